@@ -8,10 +8,14 @@ import shutil
 import socket
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 from qt4w.browser import IBrowser
 from qt4w.webcontrols import WebPage
 
+from .pool import get_current_slot
+from .util import BrowserCrashedError, FileLock
 from .webview import ChromeHeadlessWebView
 
 
@@ -22,17 +26,45 @@ class ChromeHeadlessBrowser(IBrowser):
         user_data_dir_tmpl = os.path.join(os.environ["TEMP"], "Chrome_%d")
     else:
         user_data_dir_tmpl = "/tmp/Chrome_%d"
+    port_lock_dir = os.path.join(tempfile.gettempdir(), "qt4w_ports")  # 端口锁文件目录
     instances = []
+    instances_lock = threading.RLock()
+    reserved_ports = set()
+    # 崩溃后是否自动重启并恢复页面，重启后沿用原用户数据目录，登录态不会丢失
+    recover_on_crash = os.environ.get("QT4W_RECOVER_ON_CRASH") == "1"
 
-    def __init__(self, port=9200):
+    def __init__(self, port=None):
+        self._slot = get_current_slot()
+        if port is None:
+            port = self._slot.base_port if self._slot else 9200
         self._port = port
+        self._reserved_port = None
+        self._port_lock = None
+        self._process = None
+        self._launch_args = (None, ())
+        self._watching = False
         self._webviews = []
-        ChromeHeadlessBrowser.instances.append(self)
+        with ChromeHeadlessBrowser.instances_lock:
+            ChromeHeadlessBrowser.instances.append(self)
+
+    @classmethod
+    def get_instances(cls, slot=None):
+        """获取浏览器实例列表的快照
+
+        :param slot: 只返回属于该槽位的浏览器，为None表示返回全部
+        :type  slot: BrowserSlot
+        """
+        with cls.instances_lock:
+            return [it for it in cls.instances if slot is None or it.slot is slot]
 
     @property
     def port(self):
         return self._port
 
+    @property
+    def slot(self):
+        return self._slot
+
     @property
     def webview(self):
         return self._webviews[-1] if self._webviews else None
@@ -62,12 +94,59 @@ class ChromeHeadlessBrowser(IBrowser):
             sock.close()
             return True
 
+    def _lock_port(self, port):
+        """通过锁文件在进程间预留端口，锁被其它进程持有时返回None"""
+        if not os.path.isdir(self.port_lock_dir):
+            try:
+                os.makedirs(self.port_lock_dir)
+            except OSError:
+                if not os.path.isdir(self.port_lock_dir):
+                    raise
+        lock = FileLock(os.path.join(self.port_lock_dir, "%d.lock" % port))
+        if not lock.acquire(blocking=False):
+            return None
+        return lock
+
     def get_next_free_port(self, port):
-        """获取下一个空闲的端口"""
-        while not self.is_port_free(port):
-            port += 1
+        """获取下一个空闲的端口，并在当前进程和其它进程中预留该端口"""
+        min_port = port
+        max_port = self._slot.max_port if self._slot else 65535
+        wrapped = False
+        with ChromeHeadlessBrowser.instances_lock:
+            while True:
+                if port > max_port and self._slot and min_port > self._slot.base_port:
+                    # 从槽位的起始端口继续查找
+                    port = self._slot.base_port
+                    wrapped = True
+                if port > max_port or (wrapped and port >= min_port):
+                    raise RuntimeError(
+                        "No free port in range %d-%d"
+                        % (self._slot.base_port if wrapped else min_port, max_port)
+                    )
+                if port == self._reserved_port:
+                    if self.is_port_free(port):
+                        return port  # 当前实例已预留的端口，如崩溃的浏览器使用的端口
+                elif port not in ChromeHeadlessBrowser.reserved_ports:
+                    lock = self._lock_port(port)
+                    if lock:
+                        if self.is_port_free(port):
+                            break
+                        lock.release()
+                port += 1
+            self._release_port()
+            ChromeHeadlessBrowser.reserved_ports.add(port)
+            self._reserved_port = port
+            self._port_lock = lock
         return port
 
+    def _release_port(self):
+        with ChromeHeadlessBrowser.instances_lock:
+            ChromeHeadlessBrowser.reserved_ports.discard(self._reserved_port)
+            self._reserved_port = None
+            if self._port_lock:
+                self._port_lock.release()
+                self._port_lock = None
+
     def open_url(self, url, page_cls=None, proxy_server=None, **kwargs):
         """打开一个url，返回page_cls类的实例
 
@@ -77,6 +156,76 @@ class ChromeHeadlessBrowser(IBrowser):
         :type page_cls: Class
         :param proxy_server: 使用的代理服务器地址
         :type proxy_server: string
+        :param session: 打开url前要还原的登录态快照名称，见capture_session
+        :type session: string
+        """
+        session = kwargs.get("session")
+        snapshot = None
+        if session:
+            snapshot = ChromeHeadlessWebView.session_store.load(session)
+            if not snapshot:
+                logging.info(
+                    "[%s] Session %s not found or expired"
+                    % (self.__class__.__name__, session)
+                )
+
+        launch_args = (proxy_server, tuple(kwargs.get("extra_params") or ()))
+        if self._can_reuse(launch_args):
+            return self._reuse_url(url, page_cls, snapshot)
+
+        target_url = url
+        if snapshot:
+            url = "about:blank"  # 还原登录态后再打开目标url
+        self._launch_args = launch_args
+        self._launch(url, *self._launch_args)
+        self._start_watch()
+        webview = ChromeHeadlessWebView(self._port)
+        if snapshot:
+            webview.restore_session(snapshot, target_url)
+        if webview not in self._webviews:
+            self._webviews.append(webview)
+        return (page_cls or WebPage)(webview)
+
+    def _can_reuse(self, launch_args):
+        """槽位中是否有空闲且启动参数相同的预热浏览器"""
+        slot = self._slot
+        if not slot or slot.owner is not None or not slot.is_alive():
+            return False
+        if slot.launch_args != launch_args:
+            logging.info(
+                "[%s] Shutdown chrome in %r because launch args changed"
+                % (self.__class__.__name__, slot)
+            )
+            slot.shutdown()
+            return False
+        return True
+
+    def _reuse_url(self, url, page_cls=None, snapshot=None):
+        """在槽位中已启动的浏览器里打开url"""
+        self._slot.owner = self
+        self._port = self._slot.port
+        self._launch_args = self._slot.launch_args
+        logging.info(
+            "[%s] Reuse chrome on port %d to open %s"
+            % (self.__class__.__name__, self._port, url)
+        )
+        self._start_watch()
+        webview = ChromeHeadlessWebView(self._port)
+        webview.reset(url, self._slot.origins)  # 清理上一个用例遗留的状态
+        self._slot.origins.clear()
+        if snapshot:
+            webview.restore_session(snapshot, url)
+        else:
+            webview.debugger.page.navigate(url=url)
+        if webview not in self._webviews:
+            self._webviews.append(webview)
+        return (page_cls or WebPage)(webview)
+
+    def _launch(self, url, proxy_server=None, extra_params=None, profile_dir=None):
+        """启动chrome进程并打开url
+
+        :param profile_dir: 要沿用的用户数据目录，为None表示使用新的用户数据目录
+        :type  profile_dir: string
         """
         if "&" in url:
             url = url.replace("&", "\&")
@@ -86,7 +235,11 @@ class ChromeHeadlessBrowser(IBrowser):
         stdout = subprocess.PIPE
         stderr = subprocess.PIPE
         user_data_dir = self.user_data_dir_tmpl % self._port
-        if os.path.isdir(user_data_dir):
+        if profile_dir and profile_dir != user_data_dir and os.path.isdir(profile_dir):
+            if os.path.isdir(user_data_dir):
+                shutil.rmtree(user_data_dir)
+            os.rename(profile_dir, user_data_dir)
+        elif not profile_dir and os.path.isdir(user_data_dir):
             shutil.rmtree(user_data_dir)
 
         if sys.platform == "win32":
@@ -152,8 +305,8 @@ class ChromeHeadlessBrowser(IBrowser):
                     os.system("useradd %s" % username)
                 args = ["su", username, "-c", " ".join(args)]
         
-        if kwargs.get("extra_params", None):
-            for item in kwargs["extra_params"]:
+        if extra_params:
+            for item in extra_params:
                 if item not in args:
                     args.append(item)
         
@@ -165,13 +318,21 @@ class ChromeHeadlessBrowser(IBrowser):
         while time.time() - time0 < timeout:
             if self.check_server(self._port):
                 break
+            if proc and proc.poll() is not None:
+                raise BrowserCrashedError(
+                    "Chrome process exited with code %s when starting" % proc.returncode
+                )
             time.sleep(0.5)
         else:
             raise RuntimeError("Start chrome failed")
-        webview = ChromeHeadlessWebView(self._port)
-        if webview not in self._webviews:
-            self._webviews.append(webview)
-        return (page_cls or WebPage)(webview)
+        if self._slot and (
+            self._slot.owner is None
+            or (self._slot.owner is self and not self._slot.is_alive())
+        ):
+            # 槽位中的浏览器正在被其它实例使用时，新启动的浏览器只属于当前实例
+            self._slot.attach(self._port, proc, self._launch_args)
+            self._slot.owner = self
+        self._process = proc
 
     def find_by_url(self, url, page_cls=None, timeout=10):
         """在当前打开的页面中查找指定url,返回page_cls类的实例，如果未找到，返回None
@@ -183,14 +344,94 @@ class ChromeHeadlessBrowser(IBrowser):
         :param timeout: 查找超时时间，单位：秒
         :type timeout: int/float
         """
+        process = self._get_process()
+        if process and process.poll() is not None:
+            raise BrowserCrashedError(
+                "Chrome process exited with code %s" % process.returncode
+            )
         webview = ChromeHeadlessWebView(self._port, url=url, timeout=timeout)
         if webview not in self._webviews:
             self._webviews.append(webview)
         return (page_cls or WebPage)(webview)
 
+    def _get_process(self):
+        if self._process:
+            return self._process
+        if self._slot:
+            return self._slot.process
+        return None
+
+    def _start_watch(self):
+        if self._watching:
+            return
+        self._watching = True
+        t = threading.Thread(target=self._watch)
+        t.daemon = True
+        t.start()
+
+    def _watch(self, interval=0.5):
+        """监控浏览器进程和页面调试连接"""
+        while self._watching:
+            process = self._get_process()
+            if process and process.poll() is not None:
+                reason = "Chrome process exited with code %s" % process.returncode
+                for webview in list(self._webviews):
+                    webview.on_crashed(reason)
+                if not self.recover_on_crash or not self._watching:
+                    break
+                try:
+                    self._recover()
+                except Exception:
+                    logging.exception("[%s] Recover chrome failed" % self.__class__.__name__)
+                    break
+            else:
+                for webview in list(self._webviews):
+                    if not webview.crashed and not webview.connected:
+                        webview.on_crashed("Debugger connection closed")
+                    elif webview.crashed and webview.recoverable and self.recover_on_crash:
+                        try:
+                            webview.recover()
+                        except Exception:
+                            logging.exception(
+                                "[%s] Recover page failed" % self.__class__.__name__
+                            )
+                            self._watching = False
+                            break
+            time.sleep(interval)
+        self._watching = False
+
+    def _recover(self):
+        """重启浏览器并打开崩溃前的页面"""
+        webview = self.webview
+        url = webview.crash_url or "about:blank"
+        logging.warning(
+            "[%s] Relaunch chrome on port %d and open %s"
+            % (self.__class__.__name__, self._port, url)
+        )
+        self._webviews = [webview]  # 其它页面无法恢复
+        # 优先使用原端口，并沿用原用户数据目录以保留Cookie和存储数据
+        self._launch(
+            url, *self._launch_args, profile_dir=self.user_data_dir_tmpl % self._port
+        )
+        webview.recover(debugging_port=self._port)
+
+    def capture_session(self, key, origins=None, ttl=None):
+        """保存当前页面的登录态快照，后续可以通过open_url的session参数还原
+
+        :param key: 快照名称
+        :type  key: string
+        :param origins: 要保存存储数据的origin列表，为None表示当前页面的origin
+        :type  origins: list
+        :param ttl: 快照有效期，单位：秒
+        :type  ttl: int/float
+        """
+        if not self.webview:
+            raise RuntimeError("No page opened in browser")
+        return self.webview.capture_session(key, origins, ttl)
+
     def _get_process_list(self):
         process_list = []
-        if sys.platform == "linux2":
+        if sys.platform.startswith("linux"):
             root = "/proc"
             for it in os.listdir(root):
                 if not it.isdigit():
@@ -229,8 +470,27 @@ class ChromeHeadlessBrowser(IBrowser):
 
     def close(self):
         """close browser"""
-        if self in ChromeHeadlessBrowser.instances:
-            ChromeHeadlessBrowser.instances.remove(self)
+        self._watching = False
+        with ChromeHeadlessBrowser.instances_lock:
+            if self in ChromeHeadlessBrowser.instances:
+                ChromeHeadlessBrowser.instances.remove(self)
+        self._release_port()
+
+        if self._slot and self._slot.owner is self:
+            for webview in self._webviews:
+                # 其它页面会在复用时关闭，需要记录下它们访问过的origin
+                self._slot.origins.update(webview.event_recorder.origins)
+            self._slot.owner = None
+            if any(webview.crashed or not webview.connected for webview in self._webviews):
+                # chrome_master缓存的页面调试器已断开，复用时会拿到同一个调试器
+                logging.info(
+                    "[%s] Shutdown chrome in %r because page crashed"
+                    % (self.__class__.__name__, self._slot)
+                )
+                self._slot.shutdown()
+        if self._slot and (not self._process or self._process is self._slot.process):
+            # 浏览器进程由槽位管理
+            return
 
         process_list = self._get_process_list()
         chrome_pid = 0
@@ -241,6 +501,8 @@ class ChromeHeadlessBrowser(IBrowser):
             ):
                 chrome_pid = process["pid"]
                 break
+        if not chrome_pid and self._process and self._process.poll() is None:
+            chrome_pid = self._process.pid
         if not chrome_pid:
             logging.warn(
                 "[%s] Find chrome process with port %d failed"
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""大尺寸截图和PDF导出
+"""
+
+import base64
+import io
+import struct
+import zlib
+
+from PIL import Image
+
+
+def read_stream(debugger, handle, fp, chunk_size=1024 * 1024):
+    """分块读取IO流并写入文件，读取完成后关闭流
+
+    :param debugger: 页面调试器
+    :type  debugger: chrome_master.RemoteDebugger
+    :param handle: IO流句柄
+    :type  handle: string
+    :param fp: 可写的文件对象
+    :type  fp: file
+    :param chunk_size: 每次读取的最大字节数
+    :type  chunk_size: int
+    :return: int - 写入的字节数
+    """
+    size = 0
+    try:
+        while True:
+            result = debugger.send_request("IO.read", handle=handle, size=chunk_size)
+            data = result.get("data", "")
+            if result.get("base64Encoded"):
+                data = base64.b64decode(data)
+            elif not isinstance(data, bytes):
+                data = data.encode("utf8")
+            fp.write(data)
+            size += len(data)
+            if result.get("eof") or not data:
+                break
+    finally:
+        debugger.send_request("IO.close", handle=handle)
+    return size
+
+
+class PNGStreamWriter(object):
+    """按行写入RGB数据的PNG文件，内存占用与图片高度无关"""
+
+    signature = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, fp, width, height):
+        self._fp = fp
+        self._width = width
+        self._height = height
+        self._rows = 0
+        self._compressor = zlib.compressobj()
+        self._fp.write(self.signature)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    @property
+    def rows(self):
+        return self._rows
+
+    def _write_chunk(self, chunk_type, data):
+        self._fp.write(struct.pack(">I", len(data)))
+        self._fp.write(chunk_type)
+        self._fp.write(data)
+        self._fp.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def write_image(self, image):
+        """写入一块图片，宽度不一致时裁剪或补齐，超出声明高度的行被丢弃
+
+        :param image: 图片块
+        :type  image: PIL.Image
+        """
+        height = min(image.size[1], self._height - self._rows)
+        if height <= 0:
+            return
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if image.size != (self._width, height):
+            tile = Image.new("RGB", (self._width, height), (255, 255, 255))
+            tile.paste(image, (0, 0))
+            image = tile
+        data = image.tobytes()
+        stride = self._width * 3
+        raw = b"".join(
+            b"\x00" + data[i * stride : (i + 1) * stride] for i in range(height)
+        )
+        self._rows += height
+        compressed = self._compressor.compress(raw)
+        if compressed:
+            self._write_chunk(b"IDAT", compressed)
+
+    def close(self):
+        """补齐剩余的行并写入文件尾"""
+        while self._rows < self._height:
+            self.write_image(
+                Image.new(
+                    "RGB",
+                    (self._width, min(self._height - self._rows, 256)),
+                    (255, 255, 255),
+                )
+            )
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+
+
+def capture_full_page(debugger, fp, scale, tile_height=1024):
+    """分块截取整个页面并以PNG格式写入文件
+
+    :param debugger: 页面调试器
+    :type  debugger: chrome_master.RemoteDebugger
+    :param fp: 以二进制方式打开的可写文件对象
+    :type  fp: file
+    :param scale: 设备像素比
+    :type  scale: float
+    :param tile_height: 每次截取的高度，单位：CSS像素
+    :type  tile_height: int
+    :return: tuple - 图片尺寸(宽度, 高度)
+    """
+    metrics = debugger.page.getLayoutMetrics()
+    content_size = metrics.get("cssContentSize") or metrics["contentSize"]
+    content_width = content_size["width"]
+    content_height = content_size["height"]
+    width = int(round(content_width * scale))
+    height = int(round(content_height * scale))
+    writer = PNGStreamWriter(fp, width, height)
+    top = 0
+    while top < content_height:
+        clip_height = min(tile_height, content_height - top)
+        result = debugger.page.captureScreenshot(
+            format="png",
+            clip={
+                "x": 0,
+                "y": top,
+                "width": content_width,
+                "height": clip_height,
+                "scale": 1,
+            },
+            captureBeyondViewport=True,
+        )
+        tile = Image.open(io.BytesIO(base64.b64decode(result["data"])))
+        # 按累计位置计算每块的像素高度，避免取整误差累积
+        rows = int(round((top + clip_height) * scale)) - writer.rows
+        if tile.size[1] > rows:
+            tile = tile.crop((0, 0, tile.size[0], rows))
+        elif tile.size[1] < rows:
+            # 截图高度不足时补齐，避免后续分块整体上移
+            padded = Image.new("RGB", (tile.size[0], rows), (255, 255, 255))
+            padded.paste(tile, (0, 0))
+            tile.close()
+            tile = padded
+        writer.write_image(tile)
+        tile.close()
+        top += clip_height
+    writer.close()
+    return width, height
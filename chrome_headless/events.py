@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""页面事件记录
+"""
+
+import codecs
+import collections
+import time
+
+from .session import get_origin
+
+
+class EventRecorder(object):
+    """页面事件记录器
+
+    将Console日志、JavaScript异常和网络请求摘要保存在固定长度的环形缓冲区中，
+    只有在需要时(如用例失败)才写入文件。
+    """
+
+    max_console_count = 200  # 最大保存的Console日志条数
+    max_exception_count = 50  # 最大保存的JavaScript异常条数
+    max_network_count = 200  # 最大保存的网络请求条数
+    max_text_length = 512  # 单条记录的最大长度
+
+    def __init__(self):
+        self._console = collections.deque(maxlen=self.max_console_count)
+        self._exceptions = collections.deque(maxlen=self.max_exception_count)
+        self._network = collections.deque(maxlen=self.max_network_count)
+        self._requests = collections.OrderedDict()  # 未收到响应的请求
+        self._origins = set()  # 请求过的origin，复用浏览器时用于清理存储数据
+
+    @classmethod
+    def attach(cls, debugger):
+        """在调试器上安装事件记录器，同一个调试器只安装一次
+
+        :param debugger: 页面调试器
+        :type  debugger: chrome_master.RemoteDebugger
+        :rtype: EventRecorder
+        """
+        recorder = getattr(debugger, "_qt4w_event_recorder", None)
+        if recorder:
+            return recorder
+        recorder = cls()
+        on_recv_notify_msg = debugger.on_recv_notify_msg
+
+        def _on_recv_notify_msg(method, params):
+            recorder.on_event(method, params)
+            return on_recv_notify_msg(method, params)
+
+        debugger.on_recv_notify_msg = _on_recv_notify_msg
+        debugger._qt4w_event_recorder = recorder
+        return recorder
+
+    def _truncate(self, text):
+        if len(text) > self.max_text_length:
+            text = text[: self.max_text_length] + "..."
+        return text
+
+    def on_event(self, method, params):
+        """处理调试器通知消息
+
+        :param method: 消息方法名
+        :type  method: string
+        :param params: 参数字典
+        :type  params: dict
+        """
+        if method == "Runtime.consoleAPICalled":
+            text = " ".join(
+                "%s" % it.get("value", it.get("description", it["type"]))
+                for it in params.get("args", [])
+            )
+            self._console.append(
+                (time.time(), "console.%s" % params.get("type"), self._truncate(text))
+            )
+        elif method == "Runtime.exceptionThrown":
+            details = params["exceptionDetails"]
+            text = details.get("text", "")
+            if "exception" in details:
+                text = details["exception"].get("description", text)
+            text = "%s (%s:%s:%s)" % (
+                text,
+                details.get("url", ""),
+                details.get("lineNumber", 0),
+                details.get("columnNumber", 0),
+            )
+            self._exceptions.append((time.time(), "exception", self._truncate(text)))
+        elif method == "Network.requestWillBeSent":
+            if params["request"]["url"].startswith("data:"):
+                return
+            origin = get_origin(params["request"]["url"])
+            if origin:
+                self._origins.add(origin)
+            self._requests[params["requestId"]] = (
+                time.time(),
+                params["request"]["method"],
+                self._truncate(params["request"]["url"]),
+            )
+            if len(self._requests) > self.max_network_count:
+                self._requests.popitem(last=False)
+        elif method == "Network.responseReceived":
+            request = self._requests.pop(params["requestId"], None)
+            if request:
+                self._network.append(
+                    (
+                        request[0],
+                        "network",
+                        "%s %s %s %.0fms"
+                        % (
+                            request[1],
+                            request[2],
+                            params["response"]["status"],
+                            (time.time() - request[0]) * 1000,
+                        ),
+                    )
+                )
+        elif method == "Network.loadingFailed":
+            request = self._requests.pop(params["requestId"], None)
+            if request:
+                self._network.append(
+                    (
+                        request[0],
+                        "network",
+                        "%s %s failed: %s"
+                        % (request[1], request[2], params.get("errorText", "")),
+                    )
+                )
+
+    @property
+    def origins(self):
+        """所有请求过的origin"""
+        return set(self._origins)
+
+    def get_records(self):
+        """获取所有记录，按时间排序
+
+        :return: list - (时间戳, 类型, 内容)列表
+        """
+        records = list(self._console) + list(self._exceptions) + list(self._network)
+        records.sort(key=lambda it: it[0])
+        return records
+
+    def clear(self):
+        """清空记录"""
+        self._console.clear()
+        self._exceptions.clear()
+        self._network.clear()
+        self._requests.clear()
+        self._origins.clear()
+
+    def dump(self, save_path):
+        """将记录写入文件
+
+        :param save_path: 文件保存路径
+        :type  save_path: string
+        :return: int - 写入的记录条数
+        """
+        records = self.get_records()
+        with codecs.open(save_path, "w", "utf-8") as fp:
+            for timestamp, kind, text in records:
+                fp.write(
+                    "%s.%03d [%s] %s\n"
+                    % (
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                        int(timestamp * 1000) % 1000,
+                        kind,
+                        text,
+                    )
+                )
+        return len(records)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""qt4w_headless日志
+
+每个进程只有一个后台线程负责写日志文件，业务线程只需要把日志记录放入有界队列，
+队列满时丢弃日志并计数。每个用例通过open_log_file切换到自己的日志文件，
+其它线程中属于用例的日志(如CDP通信日志)通过get_route_logger写入对应用例的日志文件。
+"""
+
+import atexit
+import codecs
+import logging
+import os
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # python2没有QueueHandler，退化为同步写文件
+    QueueHandler = QueueListener = None
+
+logger_name = "qt4w_headless"
+cdp_logger_name = "qt4w_headless.cdp"
+log_format = "%(asctime)s %(levelname)s %(thread)d %(message)s"
+
+_local = threading.local()
+_lock = threading.Lock()
+_state = {}
+
+
+class RouteFilter(logging.Filter):
+    """在产生日志的线程中记录当前用例的日志文件"""
+
+    def filter(self, record):
+        if getattr(record, "log_route", None) is None:
+            record.log_route = getattr(_local, "route", None)
+        return True
+
+
+class RouteLoggerAdapter(logging.LoggerAdapter):
+    """将日志写入指定用例日志文件的LoggerAdapter，用于不属于用例线程的日志"""
+
+    def warn(self, msg, *args, **kwargs):
+        self.warning(msg, *args, **kwargs)
+
+
+class RoutingFileHandler(logging.Handler):
+    """按用例切换日志文件的Handler
+
+    带有日志文件标记的记录只写入对应文件；没有标记或对应文件已关闭的记录写入默认文件。
+    """
+
+    def __init__(self, default_path):
+        logging.Handler.__init__(self)
+        self._default_path = default_path
+        self._default_stream = None
+        self._streams = {}
+
+    def open_route(self, path):
+        self.acquire()
+        try:
+            if path not in self._streams:
+                self._streams[path] = codecs.open(path, "a", "utf-8")
+        finally:
+            self.release()
+
+    def close_route(self, path):
+        self.acquire()
+        try:
+            stream = self._streams.pop(path, None)
+            if stream:
+                stream.close()
+        finally:
+            self.release()
+
+    def emit(self, record):
+        flush_event = getattr(record, "flush_event", None)
+        if flush_event:
+            flush_event.set()
+            return
+        try:
+            msg = self.format(record)
+            if isinstance(msg, bytes):
+                # python2中str类型的日志通常是utf8编码，codecs打开的文件只接受unicode
+                msg = msg.decode("utf8", "replace")
+            msg += "\n"
+            route = getattr(record, "log_route", None)
+            stream = self._streams.get(route)
+            if not stream:
+                if not self._default_stream:
+                    self._default_stream = codecs.open(self._default_path, "a", "utf-8")
+                stream = self._default_stream
+            stream.write(msg)
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            for stream in self._streams.values():
+                stream.close()
+            self._streams = {}
+            if self._default_stream:
+                self._default_stream.close()
+                self._default_stream = None
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
+if QueueHandler:
+
+    class BoundedQueueHandler(QueueHandler):
+        """队列满时丢弃日志的QueueHandler"""
+
+        def __init__(self, log_queue):
+            QueueHandler.__init__(self, log_queue)
+            self._dropped = 0
+            self._dropped_lock = threading.Lock()
+
+        @property
+        def dropped(self):
+            return self._dropped
+
+        def enqueue(self, record):
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                with self._dropped_lock:
+                    self._dropped += 1
+
+
+def _stop():
+    if _state.get("pid") != os.getpid():
+        return
+    if _state.get("listener"):
+        try:
+            _state["listener"].stop()
+        except queue.Full:
+            pass
+    _state["file_handler"].close()
+
+
+atexit.register(_stop)
+
+
+def setup_logging(default_path, queue_size=10000):
+    """初始化当前进程的qt4w_headless日志，重复调用时直接返回
+
+    :param default_path: 不属于任何用例的日志写入的文件
+    :type  default_path: string
+    :param queue_size: 日志队列长度
+    :type  queue_size: int
+    :return: logging.Logger
+    """
+    logger = logging.getLogger(logger_name)
+    with _lock:
+        if _state.get("pid") == os.getpid():
+            return logger
+        for handler in (_state.get("queue_handler"), _state.get("file_handler")):
+            # fork出的子进程中后台线程已不存在，需要重新创建
+            if handler:
+                logger.removeHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        file_handler = RoutingFileHandler(default_path)
+        file_handler.setFormatter(logging.Formatter(log_format))
+        _state.clear()
+        _state["pid"] = os.getpid()
+        _state["file_handler"] = file_handler
+        if QueueHandler:
+            _state["queue"] = queue.Queue(queue_size)
+            queue_handler = BoundedQueueHandler(_state["queue"])
+            queue_handler.addFilter(RouteFilter())
+            _state["queue_handler"] = queue_handler
+            _state["listener"] = QueueListener(_state["queue"], file_handler)
+            _state["listener"].start()
+            logger.addHandler(queue_handler)
+        else:
+            file_handler.addFilter(RouteFilter())
+            logger.addHandler(file_handler)
+
+        cdp_logger = logging.getLogger(cdp_logger_name)
+        if os.environ.get("QT4W_CDP_LOG") == "1":
+            cdp_logger.setLevel(logging.DEBUG)
+        else:
+            # chrome_master以INFO级别输出每次JavaScript执行的脚本和结果，关闭时只保留警告和错误
+            cdp_logger.setLevel(logging.WARNING)
+    return logger
+
+
+def get_cdp_logger():
+    """获取CDP通信日志使用的logger
+
+    CDP收发日志(DEBUG级别)和JavaScript执行日志(INFO级别)只有在环境变量QT4W_CDP_LOG=1时才会输出，
+    关闭时只输出警告和错误，其它日志在logger的级别检查处直接返回，不会进入日志队列。
+    """
+    return logging.getLogger(cdp_logger_name)
+
+
+def get_route_logger(logger, route=None):
+    """获取将日志写入指定用例日志文件的logger，用于在其它线程中输出属于该用例的日志
+
+    :param logger: logger或get_route_logger返回的logger
+    :type  logger: logging.Logger
+    :param route: 用例日志文件路径，为None表示当前线程的用例日志文件
+    :type  route: string
+    :return: logging.Logger/RouteLoggerAdapter - 当前线程没有用例日志文件时返回原logger
+    """
+    if isinstance(logger, RouteLoggerAdapter):
+        logger = logger.logger
+    route = route or getattr(_local, "route", None)
+    if not route:
+        return logger
+    return RouteLoggerAdapter(logger, {"log_route": route})
+
+
+def set_route(path):
+    """设置当前线程的日志写入的用例日志文件，不打开文件
+
+    :param path: 日志文件路径，为None表示写入默认文件
+    :type  path: string
+    """
+    _local.route = path
+
+
+def flush(timeout=5):
+    """等待队列中已有的日志写入文件
+
+    :param timeout: 超时时间，单位：秒
+    :type  timeout: int/float
+    :return: bool - 是否在超时前写入完成
+    """
+    log_queue = _state.get("queue")
+    if not log_queue:
+        return True
+    flush_event = threading.Event()
+    try:
+        log_queue.put(logging.makeLogRecord({"flush_event": flush_event}), timeout=timeout)
+    except queue.Full:
+        return False
+    return flush_event.wait(timeout)
+
+
+def get_dropped_count():
+    """获取因队列满而丢弃的日志条数"""
+    queue_handler = _state.get("queue_handler")
+    return queue_handler.dropped if queue_handler else 0
+
+
+def open_log_file(path):
+    """切换当前线程的日志到指定文件
+
+    :param path: 日志文件路径
+    :type  path: string
+    """
+    _state["file_handler"].open_route(path)
+    _local.route = path
+
+
+def close_log_file(path):
+    """写入剩余日志并关闭日志文件
+
+    :param path: 日志文件路径
+    :type  path: string
+    """
+    if getattr(_local, "route", None) == path:
+        _local.route = None
+    flush()
+    _state["file_handler"].close_route(path)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""浏览器池，用于并行执行用例
+"""
+
+import logging
+import os
+import threading
+import time
+
+_local = threading.local()
+
+
+def get_current_slot():
+    """获取当前线程占用的浏览器槽位，未占用时返回None"""
+    return getattr(_local, "slot", None)
+
+
+def set_current_slot(slot):
+    """设置当前线程占用的浏览器槽位"""
+    _local.slot = slot
+
+
+class BrowserSlot(object):
+    """浏览器槽位，每个槽位绑定固定的端口区间和用户数据目录"""
+
+    def __init__(self, index, base_port, port_span):
+        self._index = index
+        self._base_port = base_port
+        self._port_span = port_span
+        self._busy = False
+        self._affinity = None
+        self._port = None
+        self._process = None
+        self._launch_args = None
+        self._owner = None
+        self._origins = set()
+        self._last_used = 0
+
+    def __repr__(self):
+        return "<%s index=%d ports=%d-%d>" % (
+            self.__class__.__name__,
+            self._index,
+            self._base_port,
+            self.max_port,
+        )
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def base_port(self):
+        return self._base_port
+
+    @property
+    def max_port(self):
+        return self._base_port + self._port_span - 1
+
+    @property
+    def port(self):
+        """当前预热浏览器使用的调试端口"""
+        return self._port
+
+    @property
+    def process(self):
+        """当前预热浏览器的进程"""
+        return self._process
+
+    @property
+    def launch_args(self):
+        """当前预热浏览器的启动参数"""
+        return self._launch_args
+
+    @property
+    def owner(self):
+        """正在使用预热浏览器的ChromeHeadlessBrowser实例，未被使用时为None"""
+        return self._owner
+
+    @owner.setter
+    def owner(self, owner):
+        self._owner = owner
+
+    @property
+    def origins(self):
+        """预热浏览器中访问过的origin"""
+        return self._origins
+
+    @property
+    def affinity(self):
+        return self._affinity
+
+    @property
+    def busy(self):
+        return self._busy
+
+    def attach(self, port, process, launch_args=None):
+        """记录槽位中启动的浏览器进程
+
+        :param port: 调试端口
+        :type  port: int
+        :param process: 浏览器进程
+        :type  process: subprocess.Popen
+        :param launch_args: 启动参数，只有启动参数相同时才会复用该浏览器
+        :type  launch_args: tuple
+        """
+        self._port = port
+        self._process = process
+        self._launch_args = launch_args
+
+    def is_alive(self):
+        """槽位中是否有可复用的浏览器进程"""
+        if not self._process or not self._port:
+            return False
+        return self._process.poll() is None
+
+    def shutdown(self):
+        """结束槽位中的浏览器进程"""
+        if self._process and self._process.poll() is None:
+            try:
+                self._process.kill()
+                self._process.wait()
+            except OSError:
+                logging.exception(
+                    "[%s] Kill chrome process failed" % self.__class__.__name__
+                )
+        self._process = None
+        self._port = None
+        self._launch_args = None
+        self._owner = None
+        self._origins = set()
+
+
+class BrowserPool(object):
+    """浏览器池
+
+    为每个并行执行的用例分配独立的浏览器槽位，槽位之间的端口和用户数据目录互不重叠。
+    用例结束后浏览器默认保持运行，相同亲和性标识的后续用例优先复用该浏览器。
+    多进程执行时，通过环境变量QT4W_WORKER_ID区分各进程的端口区间；未设置时各进程的槽位
+    端口区间重叠，端口通过锁文件在进程间预留，不会被重复使用。
+    """
+
+    def __init__(self, size=None, base_port=9200, port_span=10, keep_alive=True):
+        """
+        :param size: 槽位数量，默认为CPU核数
+        :type  size: int
+        :param base_port: 起始端口
+        :type  base_port: int
+        :param port_span: 每个槽位可用的端口数
+        :type  port_span: int
+        :param keep_alive: 用例结束后是否保留浏览器进程以供复用
+        :type  keep_alive: bool
+        """
+        if not size:
+            try:
+                import multiprocessing
+
+                size = multiprocessing.cpu_count()
+            except NotImplementedError:
+                size = 1
+        worker_id = int(os.environ.get("QT4W_WORKER_ID", "0"))
+        base_port += worker_id * size * port_span
+        self._keep_alive = keep_alive
+        self._cond = threading.Condition()
+        self._slots = [
+            BrowserSlot(i, base_port + i * port_span, port_span) for i in range(size)
+        ]
+
+    @property
+    def slots(self):
+        return self._slots
+
+    @property
+    def keep_alive(self):
+        return self._keep_alive
+
+    def _select_slot(self, affinity):
+        idle_slots = [slot for slot in self._slots if not slot.busy]
+        if not idle_slots:
+            return None
+        for slot in idle_slots:
+            if affinity is not None and slot.affinity == affinity and slot.is_alive():
+                return slot
+        for slot in idle_slots:
+            if not slot.is_alive():
+                return slot
+        # 所有空闲槽位都有其它亲和性的浏览器，回收最久未使用的那个
+        slot = min(idle_slots, key=lambda it: it._last_used)
+        slot.shutdown()
+        return slot
+
+    def acquire(self, affinity=None, timeout=None):
+        """为当前线程分配浏览器槽位
+
+        :param affinity: 亲和性标识，相同标识的用例优先复用同一个浏览器
+        :type  affinity: string
+        :param timeout: 等待空闲槽位的超时时间，单位：秒，None表示一直等待
+        :type  timeout: int/float
+        :return: BrowserSlot
+        """
+        time0 = time.time()
+        with self._cond:
+            while True:
+                slot = self._select_slot(affinity)
+                if slot:
+                    break
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    remain = timeout - (time.time() - time0)
+                    if remain <= 0:
+                        raise RuntimeError("Acquire browser slot timeout")
+                    self._cond.wait(remain)
+            slot._busy = True
+            slot._affinity = affinity
+        set_current_slot(slot)
+        return slot
+
+    def release(self, slot):
+        """释放浏览器槽位
+
+        :param slot: acquire返回的槽位
+        :type  slot: BrowserSlot
+        """
+        if not self._keep_alive:
+            slot.shutdown()
+        with self._cond:
+            slot._busy = False
+            slot._last_used = time.time()
+            self._cond.notify()
+        if get_current_slot() is slot:
+            set_current_slot(None)
+
+    def close(self):
+        """结束所有槽位中的浏览器进程"""
+        with self._cond:
+            for slot in self._slots:
+                slot.shutdown()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""登录态快照存储
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from .util import general_encode, write_json_atomic
+
+# 在指定frame中导出localStorage、sessionStorage和IndexedDB数据
+CAPTURE_STORAGE_SCRIPT = r"""(async function () {
+    function dumpStorage(storage) {
+        var result = {};
+        for (var i = 0; i < storage.length; i++) {
+            var key = storage.key(i);
+            result[key] = storage.getItem(key);
+        }
+        return result;
+    }
+    function checkValue(value, path) {
+        // 只支持可以JSON序列化的数据，其它类型还原后会丢失
+        if (value === null || typeof value !== "object") {
+            return;
+        }
+        if (Array.isArray(value)) {
+            value.forEach(function (it) { checkValue(it, path); });
+            return;
+        }
+        var type = Object.prototype.toString.call(value).slice(8, -1);
+        if (type !== "Object") {
+            throw new Error("Unsupported " + type + " value in IndexedDB " + path);
+        }
+        Object.keys(value).forEach(function (key) { checkValue(value[key], path); });
+    }
+    function wait(request) {
+        return new Promise(function (resolve, reject) {
+            request.onsuccess = function () { resolve(request.result); };
+            request.onerror = function () { reject(request.error); };
+        });
+    }
+    var result = {
+        local: dumpStorage(localStorage),
+        session: dumpStorage(sessionStorage),
+        indexeddb: []
+    };
+    var databases = indexedDB.databases ? await indexedDB.databases() : [];
+    for (var i = 0; i < databases.length; i++) {
+        var db = await wait(indexedDB.open(databases[i].name));
+        var item = {name: db.name, version: db.version, stores: []};
+        var storeNames = Array.prototype.slice.call(db.objectStoreNames);
+        for (var j = 0; j < storeNames.length; j++) {
+            var store = db.transaction(storeNames[j], "readonly").objectStore(storeNames[j]);
+            var data = await Promise.all([wait(store.getAllKeys()), wait(store.getAll())]);
+            checkValue(data, db.name + "/" + store.name);
+            var indexes = Array.prototype.slice.call(store.indexNames).map(function (name) {
+                var index = store.index(name);
+                return {name: name, keyPath: index.keyPath, unique: index.unique, multiEntry: index.multiEntry};
+            });
+            item.stores.push({
+                name: store.name,
+                keyPath: store.keyPath,
+                autoIncrement: store.autoIncrement,
+                indexes: indexes,
+                records: data[0].map(function (key, k) { return [key, data[1][k]]; })
+            });
+        }
+        db.close();
+        result.indexeddb.push(item);
+    }
+    return JSON.stringify(result);
+})();"""
+
+# 在新文档创建时还原当前origin的存储数据
+RESTORE_STORAGE_SCRIPT = r"""(function (origins) {
+    // 所有IndexedDB写入完成后才设置还原完成标记
+    var pending = 1;
+    function done() {
+        pending -= 1;
+        if (pending === 0) {
+            window.__qt4w_session_restored = true;
+        }
+    }
+    try {
+        var data = origins[location.origin];
+        if (data) {
+            Object.keys(data.local || {}).forEach(function (key) {
+                localStorage.setItem(key, data.local[key]);
+            });
+            Object.keys(data.session || {}).forEach(function (key) {
+                sessionStorage.setItem(key, data.session[key]);
+            });
+            (data.indexeddb || []).forEach(function (db) {
+                var request = indexedDB.open(db.name, db.version);
+                pending += 1;
+                request.onupgradeneeded = function () {
+                    var conn = request.result;
+                    db.stores.forEach(function (item) {
+                        if (conn.objectStoreNames.contains(item.name)) {
+                            return;
+                        }
+                        var options = {autoIncrement: item.autoIncrement};
+                        if (item.keyPath !== null) {
+                            options.keyPath = item.keyPath;
+                        }
+                        var store = conn.createObjectStore(item.name, options);
+                        item.indexes.forEach(function (index) {
+                            store.createIndex(index.name, index.keyPath, {unique: index.unique, multiEntry: index.multiEntry});
+                        });
+                        item.records.forEach(function (record) {
+                            if (item.keyPath !== null) {
+                                store.put(record[1]);
+                            } else {
+                                store.put(record[1], record[0]);
+                            }
+                        });
+                    });
+                };
+                request.onsuccess = function () {
+                    request.result.close();
+                    done();
+                };
+                request.onerror = function () {
+                    console.error("Restore IndexedDB " + db.name + " failed: " + request.error);
+                    done();
+                };
+            });
+        }
+    } catch (e) {
+        console.error("Restore session storage failed: " + e);
+    }
+    done();
+})(%s);"""
+
+# Network.setCookies支持的Cookie字段
+COOKIE_PARAM_KEYS = (
+    "name",
+    "value",
+    "domain",
+    "path",
+    "secure",
+    "httpOnly",
+    "sameSite",
+    "expires",
+    "priority",
+    "sameParty",
+    "sourceScheme",
+    "sourcePort",
+)
+
+
+def get_origin(url):
+    """获取url对应的origin"""
+    result = urlparse(url)
+    if not result.scheme or not result.netloc:
+        return None
+    return "%s://%s" % (result.scheme, result.netloc)
+
+
+def to_cookie_params(cookies):
+    """将Network.getAllCookies返回的Cookie转换为Network.setCookies的参数"""
+    result = []
+    for cookie in cookies:
+        param = dict((key, cookie[key]) for key in COOKIE_PARAM_KEYS if key in cookie)
+        if cookie.get("session"):
+            param.pop("expires", None)
+        result.append(param)
+    return result
+
+
+class SessionStore(object):
+    """登录态快照的磁盘存储
+
+    每个快照保存为一个json文件，写入时先写临时文件再重命名，可以在多个进程之间共享。
+    """
+
+    def __init__(self, root=None, ttl=3600):
+        """
+        :param root: 快照保存目录，默认为环境变量QT4W_SESSION_DIR或临时目录下的qt4w_sessions
+        :type  root: string
+        :param ttl: 快照默认有效期，单位：秒
+        :type  ttl: int/float
+        """
+        self._root = (
+            root
+            or os.environ.get("QT4W_SESSION_DIR")
+            or os.path.join(tempfile.gettempdir(), "qt4w_sessions")
+        )
+        self._ttl = ttl
+
+    @property
+    def root(self):
+        return self._root
+
+    def _get_path(self, key):
+        key = general_encode(key)
+        if not isinstance(key, bytes):
+            key = key.encode("utf8")
+        name = hashlib.sha1(key).hexdigest()
+        return os.path.join(self._root, name + ".json")
+
+    def save(self, key, snapshot, ttl=None):
+        """保存快照
+
+        :param key: 快照名称
+        :type  key: string
+        :param snapshot: 快照数据
+        :type  snapshot: dict
+        :param ttl: 有效期，单位：秒，为None表示使用默认有效期
+        :type  ttl: int/float
+        """
+        if ttl is None:
+            ttl = self._ttl
+        write_json_atomic(
+            self._get_path(key),
+            {"key": key, "expire_time": time.time() + ttl, "snapshot": snapshot},
+            private=True,  # 快照中包含登录态Cookie
+        )
+
+    def load(self, key):
+        """读取快照，快照不存在或已过期时返回None
+
+        :param key: 快照名称
+        :type  key: string
+        """
+        path = self._get_path(key)
+        try:
+            with open(path, "r") as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        if data["expire_time"] <= time.time():
+            self.remove(key)
+            return None
+        return data["snapshot"]
+
+    def remove(self, key):
+        """删除快照"""
+        try:
+            os.remove(self._get_path(key))
+        except OSError:
+            pass
@@ -4,6 +4,7 @@
 
 import logging
 import os
+import re
 import time
 
 import chrome_master
@@ -11,43 +12,67 @@ import qt4w
 import testbase.testcase as tc
 from qt4w import browser, util
 
+from . import log
 from .browser import ChromeHeadlessBrowser
 
 
 class WebHeadlessTestBase(tc.TestCase):
     """Headless Web测试基类
+
+    设置browser_pool为BrowserPool实例后，用例可以在多个线程或进程中并行执行，
+    每个用例独占一个浏览器槽位，browser_affinity相同的用例优先复用已启动的浏览器。
     """
 
     logger_path = "qt4w_headless_%s.log" % os.getpid()
-
+    browser_pool = None  # 并行执行时使用的浏览器池
+    browser_affinity = None  # 浏览器亲和性标识，默认为用例类名
+    _browser_slot = None
+    _log_dropped = 0
 
     def _clean_env(self):
         logger = logging.getLogger("qt4w_headless")
-        if os.environ.get("QT4W_DEBUG") != "1":
+        if self.browser_pool:
+            logger.info(
+                "[%s] Close browsers in %r" % (self.__class__.__name__, self._browser_slot)
+            )
+            for it in ChromeHeadlessBrowser.get_instances(self._browser_slot):
+                it.close()
+        elif os.environ.get("QT4W_DEBUG") != "1":
             logger.info("[%s] Kill all chrome processes" % self.__class__.__name__)
+            for it in ChromeHeadlessBrowser.get_instances():
+                it.close()  # 先停止崩溃监控，避免被当作崩溃处理
             ChromeHeadlessBrowser.killall()  # 清理残留进程
             ChromeHeadlessBrowser.clearall()
         else:
             logger.info("[%s] Ignore clear chrome" % self.__class__.__name__)
 
     def pre_test(self):
-        logger = logging.getLogger("qt4w_headless")
-        logger.setLevel(logging.DEBUG)
-        file_handler = logging.FileHandler(self.logger_path)
-        fmt = logging.Formatter("%(asctime)s %(levelname)s %(thread)d %(message)s")
-        file_handler.setFormatter(fmt)
-        logger.addHandler(file_handler)
-        chrome_master.set_logger(logger)
+        if self.browser_pool:
+            self._browser_slot = self.browser_pool.acquire(
+                self.browser_affinity or self.__class__.__name__
+            )
+        logger = log.setup_logging(self.__class__.logger_path)
+        # 每个用例使用单独的日志文件
+        self.logger_path = "qt4w_headless_%s_%s.log" % (
+            os.getpid(),
+            re.sub(r"[^\w.-]", "_", self.test_name),
+        )
+        log.open_log_file(self.logger_path)
+        self._log_dropped = log.get_dropped_count()
+        chrome_master.set_logger(log.get_cdp_logger())
         qt4w.set_logger(logger)
         browser.Browser.register_browser(
             "Chrome", "chrome_headless.browser.ChromeHeadlessBrowser"
         )  # 注册Chrome Headless浏览器
         self._clean_env()
+        for it in ChromeHeadlessBrowser.get_instances(self._browser_slot):
+            # 未关闭的浏览器中的事件记录属于之前的用例
+            for webview in it.webviews:
+                webview.event_recorder.clear()
 
     def post_test(self):
         logger = logging.getLogger("qt4w_headless")
         logger.info("[%s] post_test run" % self.__class__.__name__)
-        self._clean_env()
 
         log_files = {self.logger_path: self.logger_path}
         if (
@@ -55,7 +80,7 @@ class WebHeadlessTestBase(tc.TestCase):
             and os.environ.get("QT4W_AUTO_RECORD_SCREEN") == "1"
         ):
             # 保存录屏文件
-            for browser in ChromeHeadlessBrowser.instances:
+            for browser in ChromeHeadlessBrowser.get_instances(self._browser_slot):
                 for i, webview in enumerate(browser.webviews):
                     video_path = "%s_%s_%s_%d.mp4" % (
                         self.__class__.__name__,
@@ -72,13 +97,24 @@ class WebHeadlessTestBase(tc.TestCase):
                         self.test_result.info(
                             "Page %s的录屏" % webview.url, attachments={"录屏": video_path}
                         )
+        self._clean_env()
+        if self._browser_slot:
+            self.browser_pool.release(self._browser_slot)
+        dropped = log.get_dropped_count() - self._log_dropped
+        if dropped:
+            logger.warning(
+                "[%s] %d log records dropped because log queue is full"
+                % (self.__class__.__name__, dropped)
+            )
+        log.close_log_file(self.logger_path)
         self.test_result.info("QT4W日志", attachments=log_files)
 
     def get_extra_fail_record(self):
         """用例执行失败时，用于获取用例相关的错误记录和附件信息
         """
+        log.set_route(self.logger_path)  # 在QTAF创建的线程中执行
         pic_attachments = {}
-        for browser in ChromeHeadlessBrowser.instances:
+        for browser in ChromeHeadlessBrowser.get_instances(self._browser_slot):
             for i, webview in enumerate(browser.webviews):
                 pic_path = "%s_%s_%s_%d.png" % (
                     self.__class__.__name__,
@@ -93,5 +129,12 @@ class WebHeadlessTestBase(tc.TestCase):
                     util.logger.exception("Take screenshot failed")
                 else:
                     pic_attachments["Page %s的截图" % webview.url] = pic_path
+                event_path = pic_path[:-4] + "_events.log"
+                try:
+                    webview.event_recorder.dump(event_path)
+                except:
+                    util.logger.exception("Save page events failed")
+                else:
+                    pic_attachments["Page %s的事件记录" % webview.url] = event_path
 
         return {}, pic_attachments
@@ -3,7 +3,85 @@
 '''公共函数库
 '''
 
+import contextlib
+import json
+import os
 import sys
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class BrowserCrashedError(RuntimeError):
+    '''浏览器进程或页面已崩溃
+    '''
+    pass
+
+
+class FileLock(object):
+    '''基于文件的进程间互斥锁，持有锁的进程退出后自动释放
+    '''
+
+    def __init__(self, path):
+        self._path = path
+        self._fp = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def acquire(self, blocking=True):
+        '''获取锁
+
+        :param blocking: 是否等待其它进程释放锁
+        :type  blocking: bool
+        :return: bool - 是否获取成功
+        '''
+        fp = open(self._path, "a+")
+        try:
+            if fcntl:
+                flags = fcntl.LOCK_EX
+                if not blocking:
+                    flags |= fcntl.LOCK_NB
+                fcntl.flock(fp.fileno(), flags)
+            else:
+                fp.seek(0)
+                msvcrt.locking(
+                    fp.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1
+                )
+        except (IOError, OSError):
+            fp.close()
+            if blocking:
+                raise
+            return False
+        self._fp = fp
+        return True
+
+    def release(self):
+        '''释放锁
+        '''
+        if not self._fp:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+            else:
+                self._fp.seek(0)
+                msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
 
 
 def general_encode(s):
@@ -17,3 +95,47 @@ def general_encode(s):
     elif is_py3 and isinstance(s, (bytes,)):
         s = s.decode('utf8')
     return s
+
+
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+@contextlib.contextmanager
+def open_atomic(path, mode="w", private=False):
+    '''先写临时文件，成功后再重命名为目标文件，失败时删除临时文件，
+    避免其它进程读到或失败后残留写了一半的文件
+
+    :param private: 是否只允许当前用户读写，为False时与open创建的文件权限一致
+    :type  private: bool
+    '''
+    root = os.path.dirname(path) or "."
+    if not os.path.isdir(root):
+        try:
+            os.makedirs(root)
+        except OSError:
+            if not os.path.isdir(root):
+                raise
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as fp:
+            yield fp
+        if not private:
+            # mkstemp创建的文件权限为0600
+            os.chmod(tmp_path, 0o666 & ~_umask)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    if hasattr(os, "replace"):
+        os.replace(tmp_path, path)
+    else:
+        if os.path.isfile(path) and os.name == "nt":
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+def write_json_atomic(path, data, private=False):
+    '''原子写入json文件，private参数见open_atomic
+    '''
+    with open_atomic(path, private=private) as fp:
+        json.dump(data, fp)
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+"""截图比对
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from .util import FileLock, open_atomic, write_json_atomic
+
+
+def _to_array(image):
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return np.asarray(image, dtype=np.int16)
+
+
+def get_image_digest(image):
+    """计算图片像素数据的摘要，摘要相同表示图片完全一致
+
+    :param image: 图片
+    :type  image: PIL.Image
+    :return: string
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    digest = hashlib.sha1(("%dx%d:" % image.size).encode("utf8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def get_image_hash(image, hash_size=8):
+    """计算图片的感知哈希(dHash)，内容相近的图片哈希值的汉明距离也较小
+
+    :param image: 图片
+    :type  image: PIL.Image
+    :param hash_size: 哈希边长，哈希位数为hash_size的平方
+    :type  hash_size: int
+    :return: int
+    """
+    image = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if it else "0" for it in bits), 2)
+
+
+def get_hash_distance(hash1, hash2):
+    """计算两个感知哈希之间的汉明距离"""
+    return bin(hash1 ^ hash2).count("1")
+
+
+class CompareResult(object):
+    """截图比对结果"""
+
+    def __init__(self, diff_pixels, total_pixels, threshold, mask=None):
+        self._diff_pixels = diff_pixels
+        self._total_pixels = total_pixels
+        self._threshold = threshold
+        self._mask = mask
+
+    def __bool__(self):
+        return self.passed
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "<%s passed=%s diff_ratio=%.4f>" % (
+            self.__class__.__name__,
+            self.passed,
+            self.diff_ratio,
+        )
+
+    @property
+    def diff_pixels(self):
+        """不同的像素数"""
+        return self._diff_pixels
+
+    @property
+    def diff_ratio(self):
+        """不同的像素占比"""
+        if not self._total_pixels:
+            return 1.0 if self._diff_pixels else 0.0
+        return float(self._diff_pixels) / self._total_pixels
+
+    @property
+    def passed(self):
+        return self.diff_ratio <= self._threshold
+
+    @property
+    def mask(self):
+        """差异掩码，不同的像素为True，图片尺寸不一致或未加载基准图时为None
+
+        :rtype: numpy.ndarray
+        """
+        return self._mask
+
+    def save_mask(self, save_path):
+        """将差异掩码保存为黑白图片，白色表示不同的像素
+
+        :param save_path: 文件保存路径
+        :type  save_path: string
+        """
+        if self._mask is None:
+            raise RuntimeError("No diff mask available")
+        Image.fromarray(self._mask.astype(np.uint8) * 255, "L").save(save_path)
+
+
+def compare_images(image, baseline, tolerance=0, ignore_regions=None, threshold=0):
+    """比较两张图片
+
+    :param image: 要比较的图片
+    :type  image: PIL.Image
+    :param baseline: 基准图片
+    :type  baseline: PIL.Image
+    :param tolerance: 单个通道允许的最大差值，差值不超过该值的像素视为相同
+    :type  tolerance: int
+    :param ignore_regions: 忽略比较的区域列表，每个区域为(x, y, width, height)
+    :type  ignore_regions: list
+    :param threshold: 允许不同的像素占比
+    :type  threshold: float
+    :rtype: CompareResult
+    """
+    total_pixels = image.size[0] * image.size[1]
+    if image.size != baseline.size:
+        return CompareResult(total_pixels, total_pixels, threshold)
+    diff = np.abs(_to_array(image) - _to_array(baseline))
+    mask = (diff > tolerance).any(axis=2)
+    for x, y, width, height in ignore_regions or []:
+        mask[max(int(y), 0) : int(y + height), max(int(x), 0) : int(x + width)] = False
+    return CompareResult(int(np.count_nonzero(mask)), total_pixels, threshold, mask)
+
+
+class BaselineIndex(object):
+    """基准图片索引
+
+    基准图片以png格式保存在目录中，index.json中记录每张图片的像素摘要和感知哈希。
+    截图与基准图片摘要一致时直接判定相同，不需要读取基准图片。
+    """
+
+    index_file = "index.json"
+
+    def __init__(self, root):
+        """
+        :param root: 基准图片目录
+        :type  root: string
+        """
+        self._root = root
+        self._index = {}
+        self._index_stat = None
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return self._root
+
+    def _get_index_path(self):
+        return os.path.join(self._root, self.index_file)
+
+    def _get_image_path(self, name):
+        return os.path.join(self._root, name + ".png")
+
+    def _get_index_stat(self):
+        # 索引文件每次都通过重命名替换，inode变化即表示文件被改写，不受时间戳精度影响
+        stat = os.stat(self._get_index_path())
+        return stat.st_ino, stat.st_size, stat.st_mtime
+
+    def _load_index(self):
+        try:
+            stat = self._get_index_stat()
+        except OSError:
+            return self._index
+        if stat != self._index_stat:
+            # 其它进程更新了索引
+            with open(self._get_index_path(), "r") as fp:
+                self._index = json.load(fp)
+            self._index_stat = stat
+        return self._index
+
+    def get(self, name):
+        """获取基准图片的索引信息，不存在时返回None"""
+        with self._lock:
+            return self._load_index().get(name)
+
+    def add(self, name, image):
+        """添加或更新基准图片
+
+        :param name: 基准图片名称
+        :type  name: string
+        :param image: 基准图片
+        :type  image: PIL.Image
+        """
+        info = {
+            "size": list(image.size),
+            "digest": get_image_digest(image),
+            "hash": "%x" % get_image_hash(image),
+        }
+        with self._lock:
+            if not os.path.isdir(self._root):
+                try:
+                    os.makedirs(self._root)
+                except OSError:
+                    if not os.path.isdir(self._root):
+                        raise
+            # 多个进程同时添加基准图片时，读取、修改和写回索引需要互斥
+            with FileLock(self._get_index_path() + ".lock"):
+                index = dict(self._load_index())
+                # 其它进程读取基准图片时不加锁，需要避免读到写了一半的文件
+                with open_atomic(self._get_image_path(name), "wb") as fp:
+                    image.save(fp, "png")
+                index[name] = info
+                write_json_atomic(self._get_index_path(), index)
+                self._index = index
+                self._index_stat = self._get_index_stat()
+
+    def load(self, name):
+        """读取基准图片
+
+        :rtype: PIL.Image
+        """
+        return Image.open(self._get_image_path(name))
+
+    def find(self, image, max_distance=5):
+        """根据感知哈希查找最相近的基准图片，不读取基准图片数据
+
+        :param image: 要查找的图片
+        :type  image: PIL.Image
+        :param max_distance: 允许的最大汉明距离
+        :type  max_distance: int
+        :return: string - 基准图片名称，未找到时返回None
+        """
+        image_hash = get_image_hash(image)
+        result = None
+        min_distance = max_distance + 1
+        with self._lock:
+            index = self._load_index()
+        for name in sorted(index):
+            distance = get_hash_distance(image_hash, int(index[name]["hash"], 16))
+            if distance < min_distance:
+                result, min_distance = name, distance
+        return result
+
+    def compare(
+        self,
+        name,
+        image,
+        tolerance=0,
+        ignore_regions=None,
+        threshold=0,
+        max_hash_distance=None,
+    ):
+        """将图片与基准图片比较
+
+        :param name: 基准图片名称
+        :type  name: string
+        :param image: 要比较的图片
+        :type  image: PIL.Image
+        :param tolerance: 单个通道允许的最大差值
+        :type  tolerance: int
+        :param ignore_regions: 忽略比较的区域列表，每个区域为(x, y, width, height)
+        :type  ignore_regions: list
+        :param threshold: 允许不同的像素占比
+        :type  threshold: float
+        :param max_hash_distance: 不为None时，感知哈希距离不超过该值即判定相同，不再逐像素比较
+        :type  max_hash_distance: int
+        :rtype: CompareResult
+        """
+        info = self.get(name)
+        if not info:
+            raise RuntimeError("Baseline %s not found in %s" % (name, self._root))
+        total_pixels = image.size[0] * image.size[1]
+        if list(image.size) != info["size"]:
+            return CompareResult(total_pixels, total_pixels, threshold)
+        if get_image_digest(image) == info["digest"]:
+            return CompareResult(0, total_pixels, threshold)
+        if max_hash_distance is not None and not ignore_regions:
+            distance = get_hash_distance(get_image_hash(image), int(info["hash"], 16))
+            if distance <= max_hash_distance:
+                return CompareResult(0, total_pixels, threshold)
+        return compare_images(
+            image, self.load(name), tolerance, ignore_regions, threshold
+        )
+
+
+def compare_screenshot(webview, baseline_index, name, **kwargs):
+    """将WebView的截图与基准图片比较，基准图片不存在时将截图保存为基准图片
+
+    :param webview: WebView实例
+    :type  webview: ChromeHeadlessWebView
+    :param baseline_index: 基准图片索引
+    :type  baseline_index: BaselineIndex
+    :param name: 基准图片名称
+    :type  name: string
+    :param kwargs: 其它参数见BaselineIndex.compare
+    :rtype: CompareResult
+    """
+    image = webview.screenshot()
+    if not baseline_index.get(name):
+        baseline_index.add(name, image)
+    return baseline_index.compare(name, image, **kwargs)
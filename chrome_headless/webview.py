@@ -3,38 +3,120 @@
 """chrome headless webview
 """
 
+import functools
 import io
+import json
 import os
 import time
 
 from PIL import Image
 
 import chrome_master
+from chrome_master.handler import DebuggerHandler
 from qt4w import util
 from qt4w.webdriver.webkitwebdriver import WebkitWebDriver
 from qt4w.webview.webview import IWebView
 
-from .util import general_encode
+from . import log
+from .capture import capture_full_page, read_stream
+from .events import EventRecorder
+from .session import (
+    CAPTURE_STORAGE_SCRIPT,
+    RESTORE_STORAGE_SCRIPT,
+    SessionStore,
+    get_origin,
+    to_cookie_params,
+)
+from .util import BrowserCrashedError, general_encode, open_atomic
+
+
+class InspectorHandler(DebuggerHandler):
+    """Inspector命名空间的处理器"""
+
+    namespace = "Inspector"
+
+    def on_attached(self):
+        try:
+            self.enable()
+        except chrome_master.util.MethodNotFoundError:
+            self.logger.info(
+                "[%s] Inspector handler not enabled" % self.__class__.namespace
+            )
+
+    def on_recv_notify_msg(self, method, params):
+        if method == "targetCrashed":
+            self.dispatch_event("on_target_crashed", "Page target crashed", True)
+        elif method == "detached":
+            # 页面已关闭或被其它客户端接管，调试连接不可用，无法直接恢复
+            self.dispatch_event(
+                "on_target_crashed",
+                "Debugger detached: %s" % params.get("reason"),
+                False,
+            )
+
+
+def set_debugger_connected(debugger, connected):
+    """修改调试器的连接状态，标记为断开时正在等待响应的请求会立即失败
+
+    依赖chrome_master.RemoteDebugger的私有属性_connected
+    """
+    debugger._connected = connected
+
+
+def check_crashed(func):
+    """页面崩溃后调用立即抛出BrowserCrashedError，不再等待超时"""
+
+    @functools.wraps(func)
+    def _wrap_func(self, *args, **kwargs):
+        if self._crash_reason:
+            raise BrowserCrashedError(self._crash_reason)
+        try:
+            return func(self, *args, **kwargs)
+        except BrowserCrashedError:
+            raise
+        except chrome_master.util.ConnectionClosedError:
+            # 浏览器退出时调试连接先于监控线程发现崩溃断开
+            self.on_crashed("Debugger connection closed")
+            raise BrowserCrashedError(self._crash_reason)
+        except Exception:
+            if self._crash_reason:
+                # 等待中的调用因崩溃而失败
+                raise BrowserCrashedError(self._crash_reason)
+            raise
+
+    return _wrap_func
 
 
 class ChromeHeadlessWebView(IWebView):
     """chrome headless webview"""
 
+    session_store = SessionStore()  # 登录态快照存储
+
     def __init__(self, debugging_port, url=None, title=None, timeout=10):
         self._debugging_port = debugging_port
         self._url = url
         self._title = title
         self._timeout = timeout
+        self._crash_reason = None
+        self._crash_url = None
+        self._recoverable = False
+        self._attach_debugger()
+        if os.environ.get("QT4W_AUTO_RECORD_SCREEN") == "1":
+            self.start_record_screen()
+
+    def _attach_debugger(self):
         self._debugger = self.get_debugger()
+        # 调试器后台线程中的日志写入创建WebView的用例日志文件
+        self._debugger.logger = log.get_route_logger(self._debugger.logger)
+        self._event_recorder = EventRecorder.attach(self._debugger)
         self._debugger.register_handler(chrome_master.RuntimeHandler)
         self._debugger.register_handler(chrome_master.InputHandler)
         self._debugger.register_handler(chrome_master.DOMHandler)
-        self._width, self._height = self._debugger.page.get_window_size()
-        self._scale = self.get_scale()
-        self._width *= self._scale
-        self._height *= self._scale
-        if os.environ.get("QT4W_AUTO_RECORD_SCREEN") == "1":
-            self.start_record_screen()
+        self._debugger.register_handler(InspectorHandler)
+        self._debugger.inspector.register_event_listener(
+            "on_target_crashed", self.on_target_crashed
+        )
+        self._update_rect()
 
     def __eq__(self, other):
         if not other or not isinstance(other, ChromeHeadlessWebView):
@@ -44,6 +126,8 @@ class ChromeHeadlessWebView(IWebView):
     @property
     def url(self):
         if not self._url:
+            if self._crash_reason:
+                return general_encode(self._crash_url or "")
             self._url = self.eval_script([], "location.href;")
         return general_encode(self._url)
 
@@ -51,6 +135,81 @@ class ChromeHeadlessWebView(IWebView):
     def debugger(self):
         return self._debugger
 
+    @property
+    def event_recorder(self):
+        """Console日志、JavaScript异常和网络请求记录"""
+        return self._event_recorder
+
+    @property
+    def crashed(self):
+        return self._crash_reason is not None
+
+    @property
+    def crash_url(self):
+        """崩溃前页面的url"""
+        return self._crash_url
+
+    @property
+    def recoverable(self):
+        """是否可以不重启浏览器直接恢复页面"""
+        return self._recoverable
+
+    @property
+    def connected(self):
+        """调试连接是否正常"""
+        # 依赖chrome_master.RemoteDebugger的私有属性_connected，见set_debugger_connected
+        return getattr(self._debugger, "_connected", True)
+
+    def on_target_crashed(self, reason, recoverable=True):
+        """页面渲染进程崩溃或调试器分离回调"""
+        self.on_crashed(reason, recoverable)
+
+    def on_crashed(self, reason, recoverable=False):
+        """页面或浏览器崩溃，等待中和后续的调用都会立即抛出BrowserCrashedError
+
+        :param reason: 崩溃原因
+        :type  reason: string
+        :param recoverable: 是否可以不重启浏览器直接恢复页面
+        :type  recoverable: bool
+        """
+        if self._crash_reason:
+            return
+        try:
+            self._crash_url = self._debugger.page.get_frame_tree()["frame"]["url"]
+        except Exception:
+            self._crash_url = self._url
+        self._recoverable = recoverable
+        self._crash_reason = "%s, page url: %s" % (reason, self._crash_url)
+        util.logger.error("[%s] %s" % (self.__class__.__name__, self._crash_reason))
+        set_debugger_connected(self._debugger, False)
+
+    def recover(self, debugging_port=None):
+        """从崩溃中恢复并重新打开崩溃前的页面
+
+        :param debugging_port: 重启后浏览器的调试端口，为None表示浏览器未重启，只需重新加载页面
+        :type  debugging_port: int
+        """
+        crash_reason, self._crash_reason = self._crash_reason, None
+        try:
+            if debugging_port:
+                self._debugging_port = debugging_port
+                self._url = self._title = None
+                self._attach_debugger()
+            else:
+                set_debugger_connected(self._debugger, True)
+                self._debugger.page.navigate(url=self._crash_url or "about:blank")
+                self._url = None
+        except Exception:
+            self._crash_reason = crash_reason
+            if not debugging_port:
+                set_debugger_connected(self._debugger, False)
+            raise
+        finally:
+            self._recoverable = False  # 恢复失败后不再重试
+        util.logger.info(
+            "[%s] Recovered from crash: %s" % (self.__class__.__name__, crash_reason)
+        )
+
     def get_scale(self):
         result = self.eval_script([], "window.devicePixelRatio;")
         return float(result)
@@ -78,6 +237,75 @@ class ChromeHeadlessWebView(IWebView):
         """WebView控件的坐标信息"""
         return 0, 0, self._width, self._height
 
+    @check_crashed
+    def set_viewport(self, width, height, scale=1, mobile=False):
+        """修改视口尺寸和设备像素比，不需要重启浏览器
+
+        :param width: 视口宽度，单位：CSS像素
+        :type  width: int
+        :param height: 视口高度，单位：CSS像素
+        :type  height: int
+        :param scale: 设备像素比
+        :type  scale: int/float
+        :param mobile: 是否模拟移动设备
+        :type  mobile: bool
+        """
+        self._debugger.send_request(
+            "Emulation.setDeviceMetricsOverride",
+            width=int(width),
+            height=int(height),
+            deviceScaleFactor=scale,
+            mobile=mobile,
+        )
+        self._debugger.send_request("Emulation.setTouchEmulationEnabled", enabled=mobile)
+        self._scale = float(scale)
+        self._width = width * self._scale
+        self._height = height * self._scale
+
+    def reset_viewport(self):
+        """恢复浏览器启动时的视口尺寸和设备像素比"""
+        self._debugger.send_request("Emulation.clearDeviceMetricsOverride")
+        self._debugger.send_request("Emulation.setTouchEmulationEnabled", enabled=False)
+        self._update_rect()
+
+    @check_crashed
+    def reset(self, url=None, origins=None):
+        """关闭其它页面，清理Cookie、缓存、访问过的origin的存储数据和事件记录，并恢复视口设置
+
+        :param url: 接下来要打开的url
+        :type  url: string
+        :param origins: 其它需要清理存储数据的origin列表
+        :type  origins: list
+        """
+        target_info = self._debugger.send_request("Target.getTargetInfo").get(
+            "targetInfo"
+        )
+        if target_info:
+            result = self._debugger.send_request("Target.getTargets")
+            for it in result.get("targetInfos", []):
+                if it["type"] == "page" and it["targetId"] != target_info["targetId"]:
+                    self._debugger.send_request("Target.closeTarget", targetId=it["targetId"])
+        origins = set(origins or [])
+        origins |= self._event_recorder.origins
+        if url:
+            origins.add(get_origin(url))
+        for frame in self._iter_frames(self._debugger.page.get_frame_tree()):
+            origins.add(get_origin(frame["url"]))
+        self._debugger.send_request("Network.clearBrowserCookies")
+        self._debugger.send_request("Network.clearBrowserCache")
+        for origin in sorted(it for it in origins if it):
+            self._debugger.send_request(
+                "Storage.clearDataForOrigin", origin=origin, storageTypes="all"
+            )
+        self.reset_viewport()
+        self._event_recorder.clear()
+
+    def _update_rect(self):
+        self._width, self._height = self._debugger.page.get_window_size()
+        self._scale = self.get_scale()
+        self._width *= self._scale
+        self._height *= self._scale
+
     def convert_frame_tree(self, frame_tree, parent=None):
         """将frame tree转化为Frame对象"""
         frame = util.Frame(
@@ -92,6 +320,7 @@ class ChromeHeadlessWebView(IWebView):
                 self.convert_frame_tree(child, frame)
         return frame
 
+    @check_crashed
     def get_frame_id_by_xpath(self, frame_xpaths, timeout=10):
         """获取frame id"""
         time0 = time.time()
@@ -111,6 +340,7 @@ class ChromeHeadlessWebView(IWebView):
                 "Find frame %s timeout" % "".join(frame_xpaths)
             )
 
+    @check_crashed
     def eval_script(self, frame_xpaths, script):
         """在指定frame中执行JavaScript，并返回执行结果
 
@@ -129,6 +359,7 @@ class ChromeHeadlessWebView(IWebView):
         except chrome_master.util.JavaScriptError as e:
             raise util.JavaScriptError(e.frame, e.message)
 
+    @check_crashed
     def screenshot(self):
         """当前WebView的截图
         :return: PIL.Image
@@ -136,6 +367,142 @@ class ChromeHeadlessWebView(IWebView):
         screen_data = self._debugger.page.screenshot()
         return Image.open(io.BytesIO(screen_data))
 
+    def _iter_frames(self, frame_tree):
+        yield frame_tree["frame"]
+        for child in frame_tree.get("childFrames", []):
+            for frame in self._iter_frames(child):
+                yield frame
+
+    def _capture_storage(self, frame_id):
+        """导出指定frame所在origin的存储数据"""
+        result = self._debugger.page.createIsolatedWorld(
+            frameId=frame_id, worldName="qt4w_session"
+        )
+        result = self._debugger.runtime.evaluate(
+            contextId=result["executionContextId"],
+            expression=CAPTURE_STORAGE_SCRIPT,
+            awaitPromise=True,
+            returnByValue=True,
+        )
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise util.JavaScriptError(
+                frame_id,
+                details.get("exception", {}).get("description")
+                or details.get("text", ""),
+            )
+        return json.loads(result["result"]["value"])
+
+    @check_crashed
+    def capture_session(self, key=None, origins=None, ttl=None):
+        """保存当前会话的登录态，包括所有Cookie和指定origin的localStorage、sessionStorage及IndexedDB
+
+        IndexedDB中只支持可以JSON序列化的数据，包含Date、Blob、ArrayBuffer等类型的数据时抛出JavaScriptError
+
+        :param key: 快照名称，为None表示不保存到快照存储
+        :type  key: string
+        :param origins: 要保存存储数据的origin列表，为None表示当前页面的origin
+        :type  origins: list
+        :param ttl: 快照有效期，单位：秒，为None表示使用快照存储的默认有效期
+        :type  ttl: int/float
+        :return: dict - 快照数据
+        """
+        snapshot = {
+            "cookies": self._debugger.network.getAllCookies()["cookies"],
+            "origins": {},
+        }
+        frame_tree = self._debugger.page.get_frame_tree()
+        if origins is None:
+            # 缓存的url可能已过期或是查找页面时使用的正则表达式
+            origins = [get_origin(frame_tree["frame"]["url"])]
+        for frame in self._iter_frames(frame_tree):
+            origin = get_origin(frame["url"])
+            if origin in origins and origin not in snapshot["origins"]:
+                snapshot["origins"][origin] = self._capture_storage(frame["id"])
+        for origin in origins:
+            if origin not in snapshot["origins"]:
+                util.logger.warn(
+                    "[%s] No frame of origin %s found, storage not captured"
+                    % (self.__class__.__name__, origin)
+                )
+        if key:
+            self.session_store.save(key, snapshot, ttl)
+        return snapshot
+
+    @check_crashed
+    def restore_session(self, snapshot, url):
+        """还原登录态快照后打开url
+
+        :param snapshot: 快照名称或capture_session返回的快照数据
+        :type  snapshot: string/dict
+        :param url: 要打开的url
+        :type  url: string
+        :return: bool - 快照是否存在
+        """
+        if not isinstance(snapshot, dict):
+            snapshot = self.session_store.load(snapshot)
+        if not snapshot:
+            self._debugger.page.navigate(url=url)
+            self._url = None
+            return False
+        if snapshot["cookies"]:
+            self._debugger.network.setCookies(
+                cookies=to_cookie_params(snapshot["cookies"])
+            )
+        result = self._debugger.page.addScriptToEvaluateOnNewDocument(
+            source=RESTORE_STORAGE_SCRIPT % json.dumps(snapshot["origins"])
+        )
+        try:
+            self._debugger.page.navigate(url=url)
+            time0 = time.time()
+            while time.time() - time0 < self._timeout:
+                # 不使用eval_script，避免每次轮询都输出日志
+                restored = self._debugger.runtime.evaluate(
+                    expression="window.__qt4w_session_restored === true",
+                    returnByValue=True,
+                )
+                if restored["result"].get("value") is True:
+                    break
+                time.sleep(0.2)
+            else:
+                util.logger.warn(
+                    "[%s] Wait for session restored timeout" % self.__class__.__name__
+                )
+        finally:
+            self._debugger.page.removeScriptToEvaluateOnNewDocument(
+                identifier=result["identifier"]
+            )
+        self._url = None
+        return True
+
+    @check_crashed
+    def save_full_screenshot(self, save_path, tile_height=1024):
+        """分块截取整个页面并保存为png文件，内存占用与页面高度无关
+
+        :param save_path: 文件保存路径
+        :type  save_path: string
+        :param tile_height: 每次截取的高度，单位：CSS像素
+        :type  tile_height: int
+        :return: tuple - 图片尺寸(宽度, 高度)
+        """
+        with open_atomic(save_path, "wb") as fp:
+            return capture_full_page(self._debugger, fp, self._scale, tile_height)
+
+    @check_crashed
+    def save_pdf(self, save_path, chunk_size=1024 * 1024, **kwargs):
+        """将页面打印为PDF文件，数据通过IO流分块写入磁盘
+
+        :param save_path: 文件保存路径
+        :type  save_path: string
+        :param chunk_size: 每次读取的最大字节数
+        :type  chunk_size: int
+        :param kwargs: Page.printToPDF的其它参数，如landscape、printBackground
+        :return: int - 文件大小
+        """
+        result = self._debugger.page.printToPDF(transferMode="ReturnAsStream", **kwargs)
+        with open_atomic(save_path, "wb") as fp:
+            return read_stream(self._debugger, result["stream"], fp, chunk_size)
+
     def start_record_screen(self):
         """开始录屏"""
         self._debugger.page.start_screencast()
@@ -152,6 +519,7 @@ class ChromeHeadlessWebView(IWebView):
         """
         self._debugger.page.save_screen_record(save_path)
 
+    @check_crashed
     def click(self, x_offset, y_offset):
         """点击WebView中的某个坐标
         :param x_offset: 与WebView左上角的横向偏移量
@@ -163,6 +531,7 @@ class ChromeHeadlessWebView(IWebView):
         y_offset /= self._scale
         self._debugger.input.click(x_offset, y_offset)
 
+    @check_crashed
     def send_keys(self, text):
         """发送可见字符按键
 
@@ -184,6 +553,7 @@ class ChromeHeadlessWebView(IWebView):
         if keys:
             self._debugger.input.send_keys(keys)
 
+    @check_crashed
     def long_click(self, x_offset, y_offset, duration=1):
         """长按WebView中的某个坐标
 
@@ -219,6 +589,7 @@ class ChromeHeadlessWebView(IWebView):
         self.click(x_offset, y_offset)
         self.click(x_offset, y_offset)
 
+    @check_crashed
     def drag(
         self, x1, y1, x2, y2, step=10, fire_press_event=True, fire_release_event=True
     ):
@@ -253,6 +624,7 @@ class ChromeHeadlessWebView(IWebView):
             fire_release_event=fire_release_event,
         )
 
+    @check_crashed
     def hover(self, x_offset, y_offset):
         """
 
@@ -273,6 +645,7 @@ class ChromeHeadlessWebView(IWebView):
         """
         raise NotImplementedError
 
+    @check_crashed
     def upload_file(self, file_path):
         """上传文件
 
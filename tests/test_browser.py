@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import os
+import shutil
 import sys
 import subprocess
+import tempfile
+import time
 import unittest
 try:
     from unittest import mock
@@ -10,6 +14,9 @@ except:
 
 import chrome_master
 from chrome_headless.browser import ChromeHeadlessBrowser
+from chrome_headless.events import EventRecorder
+from chrome_headless.pool import BrowserPool
+from chrome_headless.util import BrowserCrashedError
 from qt4w.webcontrols import WebPage
 
 from tests.util import MockDebugger
@@ -19,11 +26,38 @@ def generic_func(*args, **kwargs):
     pass
 
 
+class MockProcess(object):
+
+    def __init__(self):
+        self.pid = 0
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
 subprocess.Popen = mock.Mock(side_effect=generic_func)
-chrome_master.ChromeMaster.find_page = mock.Mock(return_value=MockDebugger())
+chrome_master.ChromeMaster.find_page = mock.Mock(side_effect=lambda *args, **kwargs: MockDebugger())
 ChromeHeadlessBrowser.check_server = mock.Mock(return_value=True)
 
 
+class MockTargetDebugger(MockDebugger):
+
+    def send_request(self, method, **kwargs):
+        MockDebugger.send_request(self, method, **kwargs)
+        if method == "Target.getTargetInfo":
+            return {"targetInfo": {"targetId": "1", "type": "page"}}
+        elif method == "Target.getTargets":
+            return {
+                "targetInfos": [
+                    {"targetId": "1", "type": "page"},
+                    {"targetId": "2", "type": "page"},
+                    {"targetId": "3", "type": "service_worker"},
+                ]
+            }
+        return {}
+
+
 class ChromeHeadlessBrowserTest(unittest.TestCase):
     '''ChromeHeadlessBrowser单元测试
     '''
@@ -32,3 +66,133 @@ class ChromeHeadlessBrowserTest(unittest.TestCase):
         browser = ChromeHeadlessBrowser()
         webpage = browser.open_url('about:blank')
         self.assertIsInstance(webpage, WebPage)
+
+    def wait_for(self, func, timeout=3):
+        time0 = time.time()
+        while time.time() - time0 < timeout:
+            if func():
+                return True
+            time.sleep(0.1)
+        return False
+
+    def test_process_crashed(self):
+        browser = ChromeHeadlessBrowser()
+        browser.open_url('about:blank')
+        browser._process = MockProcess()
+        browser._process.returncode = -11
+        self.assertTrue(self.wait_for(lambda: browser.webview.crashed))
+        self.assertRaises(BrowserCrashedError, browser.webview.eval_script, [], "1")
+        self.assertRaises(BrowserCrashedError, browser.find_by_url, 'about:blank')
+        browser._process = None
+        browser.close()
+
+    def test_recover_on_crash(self):
+        browser = ChromeHeadlessBrowser()
+        browser.recover_on_crash = True
+        browser.open_url('about:blank')
+        browser._launch = mock.Mock(side_effect=lambda *args, **kwargs: setattr(browser, "_process", MockProcess()))
+        browser._process = MockProcess()
+        browser._process.returncode = -11
+        self.assertTrue(self.wait_for(lambda: browser._launch.called and not browser.webview.crashed))
+        browser._launch.assert_called_with(
+            'http://www.foo.com/', None, (), profile_dir=browser.user_data_dir_tmpl % browser.port
+        )
+        browser.close()
+
+    def test_recover_page_failed(self):
+        browser = ChromeHeadlessBrowser()
+        browser.recover_on_crash = True
+        browser.open_url('about:blank')
+        webview = browser.webview
+        webview.recover = mock.Mock(side_effect=RuntimeError("Recover failed"))
+        webview.on_target_crashed("Debugger detached: target_closed", False)
+        self.assertFalse(webview.recoverable)
+        webview._crash_reason = None
+        webview.on_target_crashed("Page target crashed")
+        self.assertTrue(self.wait_for(lambda: not browser._watching))
+        self.assertEqual(webview.recover.call_count, 1)
+        self.assertTrue(webview.crashed)
+        browser.close()
+
+    def test_reuse_in_slot(self):
+        pool = BrowserPool(size=1, base_port=9500)
+        slot = pool.acquire()
+        process = MockProcess()
+        process.kill = process.wait = generic_func
+        slot.attach(9500, process, (None, ()))
+        try:
+            slot.origins.add("http://www.bar.com")
+            browser = ChromeHeadlessBrowser()
+            debugger = MockTargetDebugger()
+            with mock.patch.object(EventRecorder, "clear") as clear:
+                with mock.patch.object(chrome_master.ChromeMaster, "find_page", return_value=debugger):
+                    browser.open_url('about:blank')
+                self.assertTrue(clear.called)
+            self.assertIs(slot.owner, browser)
+            self.assertIn(("Target.closeTarget", {"targetId": "2"}), debugger.requests)
+            self.assertEqual(len([it for it in debugger.requests if it[0] == "Target.closeTarget"]), 1)
+            self.assertIn(
+                ("Storage.clearDataForOrigin", {"origin": "http://www.bar.com", "storageTypes": "all"}),
+                debugger.requests,
+            )
+            requests = [it[0] for it in debugger.requests]
+            self.assertIn("Network.clearBrowserCookies", requests)
+            self.assertIn("Network.clearBrowserCache", requests)
+            self.assertIn("Emulation.clearDeviceMetricsOverride", requests)
+            self.assertEqual(slot.origins, set())
+
+            other = ChromeHeadlessBrowser()
+            other._launch = mock.Mock()
+            other.open_url('about:blank')
+            self.assertTrue(other._launch.called)
+            other.close()
+            browser.close()
+            self.assertIsNone(slot.owner)
+
+            browser = ChromeHeadlessBrowser()
+            browser._launch = mock.Mock()
+            browser.open_url('about:blank', proxy_server='127.0.0.1:8080')
+            self.assertTrue(browser._launch.called)
+            self.assertFalse(slot.is_alive())
+            browser.close()
+        finally:
+            pool.release(slot)
+
+    def test_reuse_after_crash(self):
+        pool = BrowserPool(size=1, base_port=9550)
+        slot = pool.acquire()
+        process = MockProcess()
+        process.kill = generic_func
+        process.wait = generic_func
+        slot.attach(9550, process, (None, ()))
+        try:
+            browser = ChromeHeadlessBrowser()
+            browser.open_url('about:blank')
+            self.assertIs(slot.owner, browser)
+            browser.webview.on_target_crashed("Page target crashed")
+            browser.close()
+            self.assertFalse(slot.is_alive())
+
+            browser = ChromeHeadlessBrowser()
+            browser._launch = mock.Mock()
+            browser.open_url('about:blank')
+            self.assertTrue(browser._launch.called)
+            browser.close()
+        finally:
+            pool.release(slot)
+
+    def test_keep_profile_on_relaunch(self):
+        root = tempfile.mkdtemp()
+        try:
+            browser = ChromeHeadlessBrowser(9650)
+            browser.user_data_dir_tmpl = os.path.join(root, "Chrome_%d")
+            browser._launch('about:blank')
+            profile_dir = browser.user_data_dir_tmpl % browser.port
+            os.makedirs(os.path.join(profile_dir, "Default"))
+            browser._launch('about:blank', profile_dir=profile_dir)
+            self.assertTrue(os.path.isdir(os.path.join(profile_dir, "Default")))
+            browser._launch('about:blank')
+            self.assertFalse(os.path.isdir(os.path.join(profile_dir, "Default")))
+            browser.close()
+        finally:
+            shutil.rmtree(root)
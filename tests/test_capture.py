@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from chrome_headless.capture import PNGStreamWriter, capture_full_page, read_stream
+from chrome_headless.util import open_atomic
+
+
+class MockPageHandler(object):
+
+    def __init__(self, width, height, short_rows=0):
+        self.width = width
+        self.height = height
+        self.short_rows = short_rows
+        self.clips = []
+
+    def getLayoutMetrics(self):
+        return {"cssContentSize": {"x": 0, "y": 0, "width": self.width, "height": self.height}}
+
+    def captureScreenshot(self, clip, **kwargs):
+        self.clips.append(clip)
+        color = (0, 0, 255) if len(self.clips) % 2 else (255, 0, 0)
+        image = Image.new("RGB", (int(clip["width"]), int(clip["height"]) - self.short_rows), color)
+        fp = io.BytesIO()
+        image.save(fp, "png")
+        return {"data": base64.b64encode(fp.getvalue())}
+
+
+class MockStreamDebugger(object):
+
+    def __init__(self, chunks, page=None):
+        self.chunks = list(chunks)
+        self.closed = False
+        self.page = page
+
+    def send_request(self, method, **kwargs):
+        if method == "IO.read":
+            data = self.chunks.pop(0)
+            return {"base64Encoded": True, "data": base64.b64encode(data), "eof": not self.chunks}
+        elif method == "IO.close":
+            self.closed = True
+        return {}
+
+
+class CaptureTest(unittest.TestCase):
+    '''大尺寸截图和PDF导出单元测试
+    '''
+
+    def test_read_stream(self):
+        debugger = MockStreamDebugger([b"%PDF-1.4\n", b"1234", b"%%EOF"])
+        fp = io.BytesIO()
+        self.assertEqual(read_stream(debugger, "1", fp), 18)
+        self.assertEqual(fp.getvalue(), b"%PDF-1.4\n1234%%EOF")
+        self.assertTrue(debugger.closed)
+
+    def test_png_writer(self):
+        fp = io.BytesIO()
+        writer = PNGStreamWriter(fp, 4, 5)
+        writer.write_image(Image.new("RGB", (4, 2), (255, 0, 0)))
+        writer.write_image(Image.new("RGBA", (3, 2), (0, 255, 0, 255)))
+        writer.close()
+        image = Image.open(io.BytesIO(fp.getvalue()))
+        self.assertEqual(image.size, (4, 5))
+        self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(image.getpixel((0, 3)), (0, 255, 0))
+        self.assertEqual(image.getpixel((3, 3)), (255, 255, 255))
+        self.assertEqual(image.getpixel((0, 4)), (255, 255, 255))
+
+    def test_capture_full_page(self):
+        page = MockPageHandler(20, 250)
+        fp = io.BytesIO()
+        size = capture_full_page(MockStreamDebugger([], page), fp, 1, tile_height=100)
+        self.assertEqual(size, (20, 250))
+        self.assertEqual([clip["y"] for clip in page.clips], [0, 100, 200])
+        image = Image.open(io.BytesIO(fp.getvalue()))
+        self.assertEqual(image.size, (20, 250))
+        self.assertEqual(image.getpixel((0, 150)), (255, 0, 0))
+        self.assertEqual(image.getpixel((0, 249)), (0, 0, 255))
+
+    def test_short_tile(self):
+        page = MockPageHandler(20, 250, short_rows=10)
+        fp = io.BytesIO()
+        capture_full_page(MockStreamDebugger([], page), fp, 1, tile_height=100)
+        image = Image.open(io.BytesIO(fp.getvalue()))
+        self.assertEqual(image.getpixel((0, 95)), (255, 255, 255))
+        self.assertEqual(image.getpixel((0, 100)), (255, 0, 0))
+        self.assertEqual(image.getpixel((0, 200)), (0, 0, 255))
+
+    def test_open_atomic(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, "page.png")
+            try:
+                with open_atomic(path, "wb") as fp:
+                    fp.write(b"\x89PNG")
+                    raise RuntimeError("Capture failed")
+            except RuntimeError:
+                pass
+            self.assertEqual(os.listdir(root), [])
+            with open_atomic(path, "wb") as fp:
+                fp.write(b"\x89PNG")
+            self.assertEqual(os.listdir(root), ["page.png"])
+            with open(os.path.join(root, "plain.png"), "wb") as fp:
+                fp.write(b"\x89PNG")
+            self.assertEqual(
+                os.stat(path).st_mode & 0o777,
+                os.stat(os.path.join(root, "plain.png")).st_mode & 0o777,
+            )
+            with open_atomic(path, "wb", private=True) as fp:
+                fp.write(b"\x89PNG")
+            if os.name != "nt":
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        finally:
+            shutil.rmtree(root)
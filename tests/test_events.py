@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from chrome_headless.events import EventRecorder
+
+from tests.util import MockDebugger
+
+
+class EventRecorderTest(unittest.TestCase):
+    '''EventRecorder单元测试
+    '''
+
+    def setUp(self):
+        self.debugger = MockDebugger()
+        self.recorder = EventRecorder.attach(self.debugger)
+
+    def test_attach_once(self):
+        self.assertIs(EventRecorder.attach(self.debugger), self.recorder)
+
+    def test_console(self):
+        for i in range(EventRecorder.max_console_count + 10):
+            self.debugger.on_recv_notify_msg(
+                "Runtime.consoleAPICalled",
+                {"type": "log", "args": [{"type": "string", "value": "log %d" % i}]},
+            )
+        records = self.recorder.get_records()
+        self.assertEqual(len(records), EventRecorder.max_console_count)
+        self.assertEqual(records[0][1:], ("console.log", "log 10"))
+
+    def test_exception_and_network(self):
+        self.debugger.on_recv_notify_msg(
+            "Runtime.exceptionThrown",
+            {
+                "exceptionDetails": {
+                    "text": "Uncaught",
+                    "exception": {"description": "TypeError: a is undefined"},
+                    "url": "http://www.foo.com/a.js",
+                    "lineNumber": 1,
+                    "columnNumber": 2,
+                }
+            },
+        )
+        self.debugger.on_recv_notify_msg(
+            "Network.requestWillBeSent",
+            {"requestId": "1", "request": {"method": "GET", "url": "http://www.foo.com/"}},
+        )
+        self.debugger.on_recv_notify_msg(
+            "Network.responseReceived", {"requestId": "1", "response": {"status": 404}}
+        )
+        self.debugger.on_recv_notify_msg(
+            "Network.requestWillBeSent",
+            {"requestId": "2", "request": {"method": "POST", "url": "http://www.foo.com/cgi"}},
+        )
+        self.debugger.on_recv_notify_msg(
+            "Network.loadingFailed", {"requestId": "2", "errorText": "net::ERR_FAILED"}
+        )
+        records = self.recorder.get_records()
+        self.assertEqual(
+            records[0][1:],
+            ("exception", "TypeError: a is undefined (http://www.foo.com/a.js:1:2)"),
+        )
+        self.assertTrue(records[1][2].startswith("GET http://www.foo.com/ 404 "))
+        self.assertEqual(records[2][2], "POST http://www.foo.com/cgi failed: net::ERR_FAILED")
+
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, "events.log")
+            self.assertEqual(self.recorder.dump(path), 3)
+            with open(path) as fp:
+                self.assertEqual(len(fp.readlines()), 3)
+        finally:
+            shutil.rmtree(root)
+        self.recorder.clear()
+        self.assertEqual(self.recorder.get_records(), [])
+
+    def test_origins(self):
+        self.debugger.on_recv_notify_msg(
+            "Network.requestWillBeSent",
+            {"requestId": "1", "request": {"method": "GET", "url": "https://www.foo.com/a"}},
+        )
+        self.assertEqual(self.recorder.origins, set(["https://www.foo.com"]))
+        self.recorder.clear()
+        self.assertEqual(self.recorder.origins, set())
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from chrome_headless import log
+
+
+class LogTest(unittest.TestCase):
+    '''qt4w_headless日志单元测试
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        # 每个进程只初始化一次日志，默认日志文件所在目录需要保留到所有用例结束
+        cls.default_root = tempfile.mkdtemp()
+        cls.logger = log.setup_logging(os.path.join(cls.default_root, "default.log"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.default_root)
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read_file(self, path):
+        with open(path) as fp:
+            return fp.read()
+
+    def test_utf8_bytes(self):
+        class BytesFormatter(logging.Formatter):
+            def format(self, record):
+                return record.msg  # python2中str类型的日志
+
+        path = os.path.join(self.root, "test.log")
+        handler = log.RoutingFileHandler(os.path.join(self.root, "default.log"))
+        handler.setFormatter(BytesFormatter())
+        handler.open_route(path)
+        record = logging.makeLogRecord({"msg": u"中文日志".encode("utf8"), "log_route": path})
+        handler.handle(record)
+        handler.close()
+        with io.open(path, encoding="utf8") as fp:
+            self.assertEqual(fp.read(), u"中文日志\n")
+
+    def test_switch_log_file(self):
+        path1 = os.path.join(self.root, "test1.log")
+        path2 = os.path.join(self.root, "test2.log")
+        log.open_log_file(path1)
+        self.logger.info("message in test1")
+        log.close_log_file(path1)
+        log.open_log_file(path2)
+        self.logger.info("message in test2")
+        log.close_log_file(path2)
+        self.assertIn("message in test1", self.read_file(path1))
+        self.assertNotIn("message in test2", self.read_file(path1))
+        self.assertIn("message in test2", self.read_file(path2))
+
+    def test_route(self):
+        path1 = os.path.join(self.root, "test1.log")
+        path2 = os.path.join(self.root, "test2.log")
+        log.open_log_file(path1)
+        t = threading.Thread(target=log.open_log_file, args=(path2,))
+        t.start()
+        t.join()
+        self.logger.info("message in test1")
+        t = threading.Thread(target=self.logger.info, args=("message without route",))
+        t.start()
+        t.join()
+        route_logger = log.get_route_logger(log.get_cdp_logger(), path2)
+        t = threading.Thread(target=route_logger.warn, args=("message routed to test2",))
+        t.start()
+        t.join()
+        log.close_log_file(path1)
+        log.close_log_file(path2)
+        self.assertIn("message in test1", self.read_file(path1))
+        self.assertNotIn("message in test1", self.read_file(path2))
+        self.assertNotIn("message without route", self.read_file(path1))
+        self.assertNotIn("message without route", self.read_file(path2))
+        self.assertIn("message routed to test2", self.read_file(path2))
+        self.assertNotIn("message routed to test2", self.read_file(path1))
+        self.assertIs(log.get_route_logger(route_logger), route_logger.logger)
+
+    def test_cdp_logger(self):
+        cdp_logger = log.get_cdp_logger()
+        self.assertEqual(cdp_logger.parent, self.logger)
+        if os.environ.get("QT4W_CDP_LOG") != "1":
+            self.assertFalse(cdp_logger.isEnabledFor(logging.DEBUG))
+            self.assertFalse(cdp_logger.isEnabledFor(logging.INFO))
+            self.assertTrue(cdp_logger.isEnabledFor(logging.WARNING))
+            route_logger = log.get_route_logger(cdp_logger, "test.log")
+            self.assertFalse(route_logger.isEnabledFor(logging.INFO))
+
+    @unittest.skipIf(log.QueueHandler is None, "QueueHandler not supported")
+    def test_drop(self):
+        handler = log.BoundedQueueHandler(queue.Queue(1))
+        logger = logging.getLogger("qt4w_headless_test_drop")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        for _ in range(3):
+            logger.info("message")
+        self.assertEqual(handler.dropped, 2)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import unittest
+
+from chrome_headless.browser import ChromeHeadlessBrowser
+from chrome_headless.pool import BrowserPool, get_current_slot
+from chrome_headless.util import FileLock
+
+
+class MockProcess(object):
+
+    def __init__(self):
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+    def wait(self):
+        return self.returncode
+
+
+class BrowserPoolTest(unittest.TestCase):
+    '''BrowserPool单元测试
+    '''
+
+    def test_slot_port_range(self):
+        pool = BrowserPool(size=3, base_port=9300, port_span=10)
+        ports = [(slot.base_port, slot.max_port) for slot in pool.slots]
+        self.assertEqual(ports, [(9300, 9309), (9310, 9319), (9320, 9329)])
+
+    def test_affinity(self):
+        pool = BrowserPool(size=2)
+        slot = pool.acquire("foo")
+        self.assertIs(get_current_slot(), slot)
+        slot.attach(slot.base_port, MockProcess())
+        pool.release(slot)
+        self.assertIsNone(get_current_slot())
+        other = pool.acquire("bar")
+        self.assertIsNot(other, slot)
+        self.assertIs(pool.acquire("foo"), slot)
+        pool.release(other)
+        pool.release(slot)
+        pool.close()
+        self.assertFalse(slot.is_alive())
+
+    def test_acquire_timeout(self):
+        pool = BrowserPool(size=1)
+        slot = pool.acquire()
+        self.assertRaises(RuntimeError, pool.acquire, timeout=0.1)
+        pool.release(slot)
+
+    def test_browser_in_slot(self):
+        pool = BrowserPool(size=2, base_port=9400)
+        result = {}
+
+        def worker(index):
+            slot = pool.acquire()
+            browser = ChromeHeadlessBrowser()
+            result[index] = (slot, browser.port, browser.get_next_free_port(browser.port))
+            browser.close()
+            pool.release(slot)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for slot, port, free_port in result.values():
+            self.assertEqual(port, slot.base_port)
+            self.assertTrue(slot.base_port <= free_port <= slot.max_port)
+            self.assertNotIn(free_port, ChromeHeadlessBrowser.reserved_ports)
+
+    def test_port_locked_by_other_process(self):
+        browser = ChromeHeadlessBrowser(9600)
+        lock = FileLock(os.path.join(browser.port_lock_dir, "9600.lock"))
+        browser.get_next_free_port(9600)  # 确保锁文件目录存在
+        browser.close()
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            browser = ChromeHeadlessBrowser(9600)
+            self.assertEqual(browser.get_next_free_port(9600), 9601)
+            browser.close()
+        finally:
+            lock.release()
+
+    def test_reserved_port_reused(self):
+        pool = BrowserPool(size=1, base_port=9700, port_span=3)
+        slot = pool.acquire()
+        try:
+            browser = ChromeHeadlessBrowser()
+            self.assertEqual(browser.get_next_free_port(9700), 9700)
+            self.assertEqual(browser.get_next_free_port(9700), 9700)
+            self.assertEqual(browser.get_next_free_port(9702), 9702)
+            other = ChromeHeadlessBrowser()
+            self.assertEqual(other.get_next_free_port(9702), 9700)
+            other.close()
+            browser.close()
+        finally:
+            pool.release(slot)
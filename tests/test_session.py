@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from chrome_headless.session import SessionStore, get_origin, to_cookie_params
+
+
+class SessionStoreTest(unittest.TestCase):
+    '''SessionStore单元测试
+    '''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_save_load(self):
+        store = SessionStore(self.root)
+        snapshot = {"cookies": [{"name": "uin", "value": "1"}], "origins": {}}
+        store.save("user1", snapshot)
+        self.assertEqual(store.load("user1"), snapshot)
+        self.assertEqual(SessionStore(self.root).load("user1"), snapshot)
+        self.assertIsNone(store.load("user2"))
+        store.remove("user1")
+        self.assertIsNone(store.load("user1"))
+
+    def test_unicode_key(self):
+        store = SessionStore(self.root)
+        snapshot = {"cookies": [], "origins": {}}
+        store.save(u"用户1", snapshot)
+        self.assertEqual(store.load(u"用户1"), snapshot)
+        self.assertEqual(store.load(u"用户1".encode("utf8")), snapshot)
+
+    def test_expire(self):
+        store = SessionStore(self.root, ttl=0.1)
+        store.save("user1", {"cookies": [], "origins": {}})
+        time.sleep(0.2)
+        self.assertIsNone(store.load("user1"))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_get_origin(self):
+        self.assertEqual(get_origin("https://www.foo.com:8080/a?b=1"), "https://www.foo.com:8080")
+        self.assertIsNone(get_origin("about:blank"))
+
+    def test_cookie_params(self):
+        cookies = [
+            {"name": "a", "value": "1", "domain": ".foo.com", "path": "/", "expires": -1, "size": 2, "session": True},
+            {"name": "b", "value": "2", "domain": ".foo.com", "path": "/", "expires": 1900000000, "size": 2, "session": False},
+        ]
+        result = to_cookie_params(cookies)
+        self.assertEqual(result[0], {"name": "a", "value": "1", "domain": ".foo.com", "path": "/"})
+        self.assertEqual(result[1]["expires"], 1900000000)
+        self.assertNotIn("size", result[1])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image, ImageDraw
+
+from chrome_headless import visual
+
+
+def create_image(color=(255, 255, 255), rect=None, rect_color=(0, 0, 0)):
+    image = Image.new("RGB", (64, 48), color)
+    if rect:
+        ImageDraw.Draw(image).rectangle(rect, fill=rect_color)
+    return image
+
+
+class VisualCompareTest(unittest.TestCase):
+    '''截图比对单元测试
+    '''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_compare_images(self):
+        image = create_image(rect=(10, 10, 19, 19))
+        result = visual.compare_images(image, create_image())
+        self.assertFalse(result.passed)
+        self.assertEqual(result.diff_pixels, 100)
+        self.assertTrue(result.mask[15, 15])
+        self.assertFalse(result.mask[0, 0])
+
+        result = visual.compare_images(image, create_image(), ignore_regions=[(10, 10, 10, 10)])
+        self.assertTrue(result.passed)
+
+        result = visual.compare_images(image, create_image(), threshold=0.05)
+        self.assertTrue(result.passed)
+
+    def test_tolerance(self):
+        image = create_image(color=(250, 250, 250))
+        self.assertFalse(visual.compare_images(image, create_image()))
+        self.assertTrue(visual.compare_images(image, create_image(), tolerance=5))
+
+    def test_size_mismatch(self):
+        result = visual.compare_images(create_image(), Image.new("RGB", (10, 10)))
+        self.assertEqual(result.diff_ratio, 1.0)
+        self.assertIsNone(result.mask)
+
+    def test_baseline_index(self):
+        index = visual.BaselineIndex(self.root)
+        index.add("home", create_image(rect=(10, 10, 19, 19)))
+        index.load = None  # 摘要一致时不应读取基准图片
+        self.assertTrue(index.compare("home", create_image(rect=(10, 10, 19, 19))))
+
+        other = visual.BaselineIndex(self.root)
+        self.assertFalse(other.compare("home", create_image()))
+        self.assertEqual(other.find(create_image(rect=(10, 10, 19, 19))), "home")
+        self.assertIsNone(other.find(create_image(rect=(0, 0, 63, 23)), max_distance=0))
+
+    def test_baseline_index_shared(self):
+        index1 = visual.BaselineIndex(self.root)
+        index2 = visual.BaselineIndex(self.root)
+        index1.add("home", create_image())
+        index2.add("detail", create_image(rect=(10, 10, 19, 19)))
+        index1.add("list", create_image(rect=(0, 0, 63, 23)))
+        self.assertEqual(sorted(visual.BaselineIndex(self.root)._load_index()), ["detail", "home", "list"])
+        self.assertIsNotNone(index2.get("list"))
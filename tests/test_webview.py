@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+try:
+    from unittest import mock
+except:
+    import mock
+
+import chrome_master
+from chrome_headless.util import BrowserCrashedError
+from chrome_headless.webview import ChromeHeadlessWebView
+
+from tests.util import MockDebugger, MockHandler
+
+
+class ChromeHeadlessWebViewTest(unittest.TestCase):
+    '''ChromeHeadlessWebView单元测试
+    '''
+
+    def setUp(self):
+        self.debugger = MockDebugger()
+        with mock.patch.object(chrome_master.ChromeMaster, "find_page", return_value=self.debugger):
+            self.webview = ChromeHeadlessWebView(9200)
+
+    def test_set_viewport(self):
+        self.assertEqual(self.webview.rect, (0, 0, 1280, 800))
+        self.webview.set_viewport(375, 667, 2, True)
+        self.assertEqual(self.webview.rect, (0, 0, 750, 1334))
+        self.assertEqual(
+            self.debugger.requests[0],
+            (
+                "Emulation.setDeviceMetricsOverride",
+                {"width": 375, "height": 667, "deviceScaleFactor": 2, "mobile": True},
+            ),
+        )
+        self.webview.reset_viewport()
+        self.assertEqual(self.webview.rect, (0, 0, 1280, 800))
+
+    def test_connection_closed(self):
+        error = chrome_master.util.ConnectionClosedError("Connection closed")
+        with mock.patch.object(MockHandler, "eval_script", side_effect=error):
+            self.assertRaises(BrowserCrashedError, self.webview.eval_script, [], "1")
+        self.assertTrue(self.webview.crashed)
+        self.assertFalse(self.webview.recoverable)
+
+    def test_restore_session(self):
+        results = [{"result": {"value": False}}, {"result": {"value": True}}]
+        snapshot = {"cookies": [], "origins": {}}
+        with mock.patch.object(MockHandler, "evaluate", side_effect=lambda **kwargs: results.pop(0), create=True), \
+                mock.patch.object(MockHandler, "addScriptToEvaluateOnNewDocument", return_value={"identifier": "1"}, create=True):
+            self.assertTrue(self.webview.restore_session(snapshot, "http://www.foo.com/"))
+        self.assertEqual(results, [])
+
+    def test_crash(self):
+        self.webview.on_target_crashed("Page target crashed")
+        self.assertTrue(self.webview.crashed)
+        self.assertTrue(self.webview.recoverable)
+        self.assertFalse(self.webview.connected)
+        self.assertEqual(self.webview.crash_url, "http://www.foo.com/")
+        self.assertRaises(BrowserCrashedError, self.webview.eval_script, [], "1")
+        self.assertRaises(BrowserCrashedError, self.webview.click, 10, 10)
+        self.webview.recover()
+        self.assertFalse(self.webview.crashed)
+        self.assertTrue(self.webview.connected)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import logging
+
 
 class MockHandler(object):
 
@@ -33,11 +35,19 @@ class MockHandler(object):
 class MockDebugger(object):
 
     def __init__(self, *args, **kwargs):
-        pass
+        self.requests = []
+        self.logger = logging.getLogger("chrome_master")
+
+    def send_request(self, method, **kwargs):
+        self.requests.append((method, kwargs))
+        return {}
 
     def register_handler(self, handler):
         pass
 
+    def on_recv_notify_msg(self, method, params):
+        pass
+
     @property
     def page(self):
         return MockHandler()
@@ -45,3 +55,7 @@ class MockDebugger(object):
     @property
     def runtime(self):
         return MockHandler()
+
+    @property
+    def inspector(self):
+        return MockHandler()